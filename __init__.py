@@ -9,6 +9,8 @@
 from .cyclist import *
 from .util_nodes import *
 
+cyclist_restore_memory()
+
 WEB_DIRECTORY = "./js"
 NODE_CLASS_MAPPINGS = {
     "LoopManager": LoopManager,
@@ -27,15 +29,27 @@ NODE_CLASS_MAPPINGS = {
     "MemorizeInt": MemorizeInt, 
     "RecallFloat": RecallFloat, 
     "MemorizeFloat": MemorizeFloat, 
+    "RecallIntHistory": RecallIntHistory, 
+    "RecallFloatHistory": RecallFloatHistory, 
     "RecallConditioning": RecallConditioning, 
     "MemorizeConditioning": MemorizeConditioning, 
+    "RecallModel": RecallModel, 
+    "MemorizeModel": MemorizeModel, 
+    "RecallLatent": RecallLatent, 
+    "MemorizeLatent": MemorizeLatent, 
+    "RecallImage": RecallImage, 
+    "MemorizeImage": MemorizeImage, 
       
     "CyclistMathInt": CyclistMathInt, 
     "CyclistMathFloat": CyclistMathFloat, 
+    "CyclistExpression": CyclistExpression, 
+    "CyclistMathVector": CyclistMathVector, 
     "CyclistTypeCast": CyclistTypeCast, 
     "CyclistCompare": CyclistCompare, 
+    "CyclistConvergence": CyclistConvergence, 
     "CyclistTimer": CyclistTimer, 
-    "CyclistTimerStop": CyclistTimerStop
+    "CyclistTimerStop": CyclistTimerStop, 
+    "CyclistProfiler": CyclistProfiler
 }
 NODE_DISPLAY_NAME_MAPPINGS = {
     "LoopManager": "Loop Manager",
@@ -46,8 +60,16 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "MemorizeInt": "Memorize Int", 
     "RecallFloat": "Recall Float", 
     "MemorizeFloat": "Memorize Float", 
+    "RecallIntHistory": "Recall Int History", 
+    "RecallFloatHistory": "Recall Float History", 
     "RecallConditioning": "Recall Conditioning", 
     "MemorizeConditioning": "Memorize Conditioning", 
+    "RecallModel": "Recall Model", 
+    "MemorizeModel": "Memorize Model", 
+    "RecallLatent": "Recall Latent", 
+    "MemorizeLatent": "Memorize Latent", 
+    "RecallImage": "Recall Image", 
+    "MemorizeImage": "Memorize Image", 
     "ReloadLatent": "Reload Latent", 
     "OverrideLatent": "Save Latent (Override)", 
     "ReloadImage": "Reload Image", 
@@ -56,10 +78,14 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "OverrideModel": "Save Model (Override)", 
     "CyclistTimer": "Generation Timer", 
     "CyclistTimerStop": "Force Timer Stop", 
+    "CyclistProfiler": "Cyclist Profiler", 
     "CyclistMathFloat": "Float Math", 
     "CyclistMathInt": "Int Math", 
+    "CyclistExpression": "Expression", 
+    "CyclistMathVector": "Vector Math", 
     "CyclistTypeCast": "Convert to", 
-    "CyclistCompare": "Compare Anything"
+    "CyclistCompare": "Compare Anything", 
+    "CyclistConvergence": "Convergence Check"
 }
 # Sadly, this automatic mapping is abandoned for Manager compatibility
 """NODE_CLASS_MAPPINGS = {}
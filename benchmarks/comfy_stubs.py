@@ -0,0 +1,78 @@
+"""Lightweight stand-ins for the ComfyUI modules Cyclist imports, so its real node classes can run without ComfyUI.
+
+Only what Cyclist touches is provided: folders, metadata flag, interrupt, websocket messages, routes and safetensors saving.
+Model loading is not stubbed: nodes that need real checkpoints are not benchmarked."""
+
+import os
+import sys
+import types
+import importlib.util
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "comfyui_cyclist"
+
+class StubRoutes:
+    def get(self, path):
+        return lambda handler: handler
+
+    def post(self, path):
+        return lambda handler: handler
+
+class StubPromptServer:
+    instance = None
+
+    def __init__(self):
+        self.routes = StubRoutes()
+        self.messages = 0
+
+    def send_sync(self, event, data, sid=None):
+        self.messages += 1
+
+def module(name, **attributes):
+    m = types.ModuleType(name)
+    m.__dict__.update(attributes)
+    sys.modules[name] = m
+    return m
+
+def install(output_directory):
+    """Puts stub modules into sys.modules. Everything is written into output_directory."""
+    import safetensors.torch
+
+    os.makedirs(output_directory, exist_ok=True)
+    folder_names_and_paths = {"checkpoints": ([os.path.join(output_directory, "checkpoints")], {".safetensors"}),
+                              "clip": ([os.path.join(output_directory, "clip")], {".safetensors"})}
+    module("folder_paths",
+           folder_names_and_paths=folder_names_and_paths,
+           get_output_directory=lambda: output_directory,
+           get_folder_paths=lambda name: folder_names_and_paths.get(name, ([output_directory], set()))[0],
+           get_full_path=lambda folder, name: os.path.join(folder_names_and_paths[folder][0][0], name))
+    module("nodes", interrupt_processing=lambda value=True: None)
+
+    comfy = module("comfy")
+    comfy.utils = module("comfy.utils",
+                         save_torch_file=lambda sd, path, metadata=None: safetensors.torch.save_file(sd, path, metadata=metadata),
+                         state_dict_prefix_replace=lambda sd, replace, filter_keys=False: sd)
+    comfy.sd = module("comfy.sd")
+    comfy.model_base = module("comfy.model_base")
+    comfy.model_management = module("comfy.model_management", load_models_gpu=lambda models, **kwargs: None)
+    comfy.cli_args = module("comfy.cli_args", args=types.SimpleNamespace(disable_metadata=False))
+
+    StubPromptServer.instance = StubPromptServer()
+    module("server", PromptServer=StubPromptServer)
+
+    try:
+        import aiohttp.web # Real one is light enough, if it's installed
+    except ImportError:
+        aiohttp = module("aiohttp")
+        aiohttp.web = module("aiohttp.web", json_response=lambda data, **kwargs: data)
+
+def load_cyclist():
+    """Imports the repository as a package, the way ComfyUI loads custom nodes"""
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(REPO_ROOT, "__init__.py"),
+                                                  submodule_search_locations=[REPO_ROOT])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
@@ -0,0 +1,69 @@
+"""Encode and decode time per megapixel for every Save Image (Override) format.
+
+Run from anywhere: python benchmarks/image_formats.py --megapixels 1 4 --json image_formats.json
+Needs numpy, torch, safetensors and Pillow, but not ComfyUI."""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_formats import IMAGE_FORMATS, encode_image, decode_pixels, pixels_to_image
+
+def test_pixels(megapixels, seed=0):
+    """Smooth gradients with some noise, closer to a generated image than pure noise"""
+    side = int((megapixels * 1_000_000) ** 0.5)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:side, 0:side].astype(np.float32) / side
+    pixels = np.stack((x, y, (x + y) / 2), axis=-1) * 255
+    pixels += rng.normal(0, 8, pixels.shape)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+def measure(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def run(megapixel_list, repeats):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for megapixels in megapixel_list:
+            pixels = test_pixels(megapixels)[None,]
+            actual_megapixels = pixels.shape[1] * pixels.shape[2] / 1_000_000
+            for image_format, extension in IMAGE_FORMATS.items():
+                path = os.path.join(folder, f"bench_{image_format}{extension}")
+                encode_time = measure(lambda: encode_image(path, pixels, image_format), repeats)
+                decode_time = measure(lambda: pixels_to_image(decode_pixels(path)), repeats)
+                results.append({"format": image_format,
+                                "megapixels": actual_megapixels,
+                                "encode_ms_per_mp": encode_time * 1000 / actual_megapixels,
+                                "decode_ms_per_mp": decode_time * 1000 / actual_megapixels,
+                                "file_mb": os.path.getsize(path) / 2**20})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1.0, 4.0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", help="Also save results to this file")
+    options = parser.parse_args()
+
+    results = run(options.megapixels, options.repeats)
+    print(f"{'format':<18}{'MP':>6}{'encode ms/MP':>14}{'decode ms/MP':>14}{'file MB':>10}")
+    for r in results:
+        print(f"{r['format']:<18}{r['megapixels']:>6.2f}{r['encode_ms_per_mp']:>14.1f}{r['decode_ms_per_mp']:>14.1f}{r['file_mb']:>10.2f}")
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
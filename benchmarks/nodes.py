@@ -0,0 +1,141 @@
+"""Headless benchmarks of Cyclist nodes: the real node classes run against stubbed ComfyUI modules (see comfy_stubs.py).
+
+Run from anywhere: python benchmarks/nodes.py --json nodes.json
+Needs numpy, torch, safetensors and Pillow, but not ComfyUI. Everything is written into a temporary folder."""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import comfy_stubs
+
+def measure(function, repeats, setup=None):
+    """Median and minimum time of function() in ms. setup() runs before every call and is not measured."""
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "repeats": repeats}
+
+def result(case, params, timing):
+    return dict({"case": case, "params": params}, **timing)
+
+def bench_images(modules, megapixels, batch_size, repeats):
+    cyclist, file_cache = modules["cyclist"], modules["file_cache"]
+    side = int((megapixels * 1_000_000) ** 0.5)
+    image = torch.rand(batch_size, side, side, 3)
+    results = []
+    for image_format in cyclist.IMAGE_FORMATS:
+        name = f"bench/image_{image_format}"
+        params = {"format": image_format, "megapixels": megapixels, "batch_size": batch_size}
+        save = lambda: cyclist.OverrideImage().write(name, image, background_write=False, image_format=image_format)
+        results.append(result("OverrideImage.write", params, measure(save, repeats)))
+        path = cyclist.ReloadImage.GET_FILEPATH(name)
+        read = lambda: cyclist.ReloadImage().read(name)
+        results.append(result("ReloadImage.read (decoded cache)", params, measure(read, repeats)))
+        results.append(result("ReloadImage.read (decode)", params, measure(read, repeats, setup=lambda: file_cache.decoded_cache.discard(path))))
+        is_changed = lambda: cyclist.ReloadImage.IS_CHANGED(name)
+        results.append(result("ReloadImage.IS_CHANGED (known file)", params, measure(is_changed, repeats)))
+        results.append(result("ReloadImage.IS_CHANGED (hash)", params, measure(is_changed, repeats, setup=lambda: file_cache.fingerprint_cache.entries.clear())))
+    return results
+
+def bench_latents(modules, megapixels, batch_size, repeats):
+    cyclist, file_cache = modules["cyclist"], modules["file_cache"]
+    side = int((megapixels * 1_000_000) ** 0.5) // 8
+    samples = {"samples": torch.randn(batch_size, 4, side, side)}
+    name = "bench/latent"
+    params = {"megapixels": megapixels, "batch_size": batch_size}
+    save = lambda: cyclist.OverrideLatent().write(name, samples, background_write=False)
+    read = lambda: cyclist.ReloadLatent().read(name)
+    path = os.path.join(cyclist.ReloadLatent.GET_DIR(), "bench", "latent.latent")
+    is_changed = lambda: cyclist.ReloadLatent.IS_CHANGED(name)
+    return [result("OverrideLatent.write", params, measure(save, repeats)),
+            result("ReloadLatent.read (decoded cache)", params, measure(read, repeats)),
+            result("ReloadLatent.read (decode)", params, measure(read, repeats, setup=lambda: file_cache.decoded_cache.discard(path))),
+            result("ReloadLatent.IS_CHANGED (known file)", params, measure(is_changed, repeats)),
+            result("ReloadLatent.IS_CHANGED (hash)", params, measure(is_changed, repeats, setup=lambda: file_cache.fingerprint_cache.entries.clear()))]
+
+def bench_memory_report(modules, loop_counts, repeats):
+    cyclist = modules["cyclist"]
+    memory = cyclist.cyclist_memory
+    memory.budget_bytes = memory.ttl_seconds = memory.max_loops = 0 # Nothing is evicted while loops are added
+    results = []
+    for loop_count in loop_counts:
+        for loop_id in memory.loop_ids():
+            memory.remove(loop_id)
+        cyclist.cyclist_report = cyclist.MemoryReport()
+        for i in range(loop_count):
+            cyclist.MemorizeInt().write(f"bench_loop_{i}", i)
+        params = {"loops": loop_count}
+
+        def full_report():
+            cyclist.cyclist_report = cyclist.MemoryReport()
+            for loop_id in memory.loop_ids():
+                cyclist.cyclist_report.mark_dirty(loop_id)
+            cyclist.cyclist_report.full()
+        results.append(result("memory report (all loops)", params, measure(full_report, repeats)))
+        write = lambda: cyclist.MemorizeInt().write("bench_loop_0", 1) # Memorize, then report changes to UI
+        results.append(result("MemorizeInt.write with report update", params, measure(write, repeats)))
+    return results
+
+def bench_compare(modules, megapixels, batch_size, repeats):
+    util_nodes = modules["util_nodes"]
+    side = int((megapixels * 1_000_000) ** 0.5)
+    a = torch.rand(batch_size, side, side, 3)
+    b = (a + torch.randn_like(a) * 0.01).clamp_(0, 1)
+    results = []
+    for metric in util_nodes.TENSOR_METRICS:
+        params = {"metric": metric, "megapixels": megapixels, "batch_size": batch_size}
+        compare = lambda: util_nodes.CyclistCompare().compare("less than", a, b, tensor_metric=metric, threshold=0.001)
+        results.append(result("CyclistCompare.compare", params, measure(compare, repeats)))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--compare-megapixels", type=float, default=16.0, help="Image size for CyclistCompare")
+    parser.add_argument("--loops", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Loop counts for the memory report")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", help="Also save results to this file")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        comfy_stubs.install(output_directory)
+        comfy_stubs.load_cyclist()
+        modules = {name: sys.modules[f"{comfy_stubs.PACKAGE_NAME}.{name}"]
+                   for name in ("cyclist", "util_nodes", "file_cache", "memory_snapshot")}
+        modules["memory_snapshot"].SNAPSHOT_ENABLED = False # Journal writes would be measured along with the nodes
+
+        results = []
+        results += bench_images(modules, options.megapixels, options.batch_size, options.repeats)
+        results += bench_latents(modules, options.megapixels, options.batch_size, options.repeats)
+        results += bench_memory_report(modules, options.loops, options.repeats)
+        results += bench_compare(modules, options.compare_megapixels, options.batch_size, options.repeats)
+        modules["cyclist"].background_writer.flush_all()
+
+    for r in results:
+        params = ", ".join(f"{key}={value}" for key, value in r["params"].items())
+        print(f"{r['case']:<42}{params:<48}{r['median_ms']:>10.2f} ms (min {r['min_ms']:.2f})")
+    if options.json:
+        report = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "python": platform.python_version(),
+                  "torch": torch.__version__,
+                  "machine": platform.machine(),
+                  "results": results}
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
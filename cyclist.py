@@ -1,15 +1,12 @@
 import json
 import os
-import hashlib
 import logging
 import time
 import sys
+import threading
 
 import numpy as np
 import torch
-import safetensors.torch
-from PIL import Image, ImageOps
-from PIL.PngImagePlugin import PngInfo
 
 import folder_paths
 from folder_paths import folder_names_and_paths
@@ -17,66 +14,211 @@ import nodes
 import comfy.utils
 import comfy.sd
 import comfy.model_base
+import comfy.model_management
 from comfy.cli_args import args
 from server import PromptServer
+from aiohttp import web
+
+from .file_cache import file_fingerprint, decoded_cache, checkpoint_cache
+from .file_writer import background_writer
+from .file_formats import IMAGE_FORMATS, IMAGE_EXTENSIONS, encode_image, decode_pixels, pixels_to_image, load_latent
+from .memory_store import CyclistMemory
+from .tensor_offload import OFFLOAD_MODES, OFFLOAD_DTYPES, MEMORY_PLACEMENTS, offload_value, restore_value, offload_description, place_value
+from .memory_snapshot import MemorySnapshot
+from .value_history import HISTORY_CAPACITY, ValueHistory
+from .util_nodes import as_tensor
+from .profiler import profiler
+from .timer_stats import IterationStats
+from .loop_driver import LoopDrivers
+from .model_delta import DELTA_MANIFEST_EXTENSION, save_delta_checkpoint, load_delta_checkpoint, collect_garbage
 
 DEFAULT_LOOP_ID = "ForLoop_1"
 
-cyclist_memory = {}
+cyclist_memory = CyclistMemory()
+
+def cyclist_check_write(filename, vartype, has_fallback=False):
+    """Reports once if the last background write of this file has failed: what's on disk is outdated or missing then.
+    Raises, unless there is a fallback to go on with."""
+    failure = background_writer.take_failure(filename, vartype)
+    if failure is None:
+        return
+    err = f"Last save of {vartype} '{filename}' has failed, so the file is outdated. \n{failure}"
+    if has_fallback:
+        logging.warning(f"Cyclist: {err}")
+        return
+    err = f"ERROR: {err}"
+    print(err)
+    raise Exception(err)
 
 def cyclist_file_state(loop_id, vartype):
     global cyclist_memory
-    extension = {"LATENT": ".latent", "IMAGE": ".png", "MODEL": ".safetensors"}
+    extensions = {"LATENT": (".latent", ), "IMAGE": IMAGE_EXTENSIONS, "MODEL": (".safetensors", DELTA_MANIFEST_EXTENSION)}
     folder = {"LATENT": ReloadLatent.GET_DIR(),
               "IMAGE": ReloadImage.GET_DIR(),
               "MODEL": ReloadModel.GET_DIR(loop_id)}
     
     subfolder = os.path.dirname(os.path.normpath(loop_id))
     local_folder = os.path.join(folder[vartype], subfolder)
-    local_filename = f"{os.path.basename(os.path.normpath(loop_id))}{extension[vartype]}"
-    full_filepath = os.path.join(local_folder, local_filename)
-
-    file_exists = os.path.isfile(full_filepath)
-    counter_exists = loop_id in cyclist_memory and vartype in cyclist_memory[loop_id] and "counter" in cyclist_memory[loop_id][vartype]
-    if file_exists and counter_exists:
-        return f"(#{cyclist_memory[loop_id][vartype]['counter']}){vartype}: {local_filename}\n"
-    if file_exists and not counter_exists:
+    file_exists = False
+    for extension in extensions[vartype]:
+        local_filename = f"{os.path.basename(os.path.normpath(loop_id))}{extension}"
+        full_filepath = os.path.join(local_folder, local_filename)
+        if os.path.isfile(full_filepath) or background_writer.is_pending(full_filepath):
+            file_exists = True
+            break
+    counter = cyclist_memory.counter(loop_id, vartype)
+    if file_exists and counter is not None:
+        return f"(#{counter}){vartype}: {local_filename}\n"
+    if file_exists and counter is None:
         return f"{vartype}: {local_filename} <-- File exists before 1st loop!\n"
-    if not file_exists and counter_exists:
-        return f"(#{cyclist_memory[loop_id][vartype]['counter']}){vartype}: -- File doesn't exist!\n"
+    if not file_exists and counter is not None:
+        return f"(#{counter}){vartype}: -- File doesn't exist!\n"
     return ""
 
-def cyclist_memory_report():
+def cyclist_loop_report(loop_id):
+    """One loop's section of the memory report, or None if there's no such loop in memory"""
     global cyclist_memory
-    memory_content = ""
+    if not loop_id in cyclist_memory:
+        return None
+    memory_content = f"{loop_id}:\n"
+    loop_size = cyclist_memory.loop_size(loop_id)
+    if loop_size > 0:
+        memory_content = f"{loop_id} ({loop_size / 2**20:.1f} MB in memory):\n"
+    for vartype in ("INT", "FLOAT", "STRING"):
+        entry = cyclist_memory.entry(loop_id, vartype)
+        if entry is not None and entry.has_value:
+            memory_content += f"(#{entry.counter}){vartype}: {entry.value}\n"
+    entry = cyclist_memory.entry(loop_id, "CONDITIONING")
+    if entry is not None and entry.has_value:
+        offloaded = offload_description(entry.value)
+        memory_content += f"(#{entry.counter})CONDITIONING: -- exists -- ({entry.size / 2**20:.1f} MB{', ' + offloaded if offloaded else ''})\n"
+    
+    for vartype in ("LATENT", "IMAGE"):
+        entry = cyclist_memory.entry(loop_id, vartype)
+        if entry is not None and entry.has_value:
+            memory_content += f"(#{entry.counter}){vartype}: -- exists -- ({entry.size / 2**20:.1f} MB)\n"
+        else:
+            memory_content += cyclist_file_state(loop_id, vartype)
+    entry = cyclist_memory.entry(loop_id, "MODEL")
+    if entry is not None and entry.has_value:
+        memory_content += f"(#{entry.counter})MODEL: -- exists --\n"
+    else:
+        memory_content += cyclist_file_state(loop_id, "MODEL")
+    
+    return memory_content[:-1]
+
+class MemoryReport:
+    """Memory report split by loops. Only sections of loops marked as changed are rebuilt,
+    and UI only gets sections changed since the previous update."""
+
+    def __init__(self):
+        self.sections = {} # loop_id -> text, in order of appearance
+        self.dirty = set() # Loops to rebuild
+        self.unsent = set() # Loops changed since the last UI update
+        self.revision = 0
+        self.lock = threading.RLock()
+
+    def mark_dirty(self, loop_id):
+        with self.lock:
+            self.dirty.add(loop_id)
+
+    def refresh(self):
+        with self.lock:
+            for loop_id in self.dirty:
+                try:
+                    text = cyclist_loop_report(loop_id)
+                except:
+                    text = f"{loop_id}:\n-- Memory report failure --"
+                    logging.warn("Memory report failed to assemble. Strange, but harmless.")
+                if text is None:
+                    if self.sections.pop(loop_id, None) is None:
+                        continue
+                elif self.sections.get(loop_id) == text:
+                    continue
+                else:
+                    self.sections[loop_id] = text
+                self.unsent.add(loop_id)
+            self.dirty.clear()
+
+    def update(self):
+        """UI payload with changed sections only. Text of None means the loop is gone.
+        "base" is the revision this update applies to; UI that has another one should ask for the full report."""
+        with self.lock:
+            self.refresh()
+            base = self.revision
+            if self.unsent:
+                self.revision += 1
+            changes = {loop_id: self.sections.get(loop_id) for loop_id in self.unsent}
+            self.unsent.clear()
+            return {"base": base, "revision": self.revision, "sections": changes}
+
+    def full(self):
+        with self.lock:
+            self.refresh()
+            if self.unsent:
+                self.revision += 1
+                self.unsent.clear()
+            return {"base": None, "revision": self.revision, "sections": dict(self.sections)}
+
+    def text(self):
+        with self.lock:
+            self.refresh()
+            memory_content = "\n\n".join(reversed(self.sections.values()))
+        if (memory_content == ""):
+            memory_content = "-- Memory empty --"
+        return memory_content
+
+cyclist_report = MemoryReport()
+
+def cyclist_memory_report():
+    """Changes of the memory report for UI"""
+    return cyclist_report.update()
+
+@PromptServer.instance.routes.get("/cyclist/memory_report")
+async def cyclist_memory_report_route(request):
+    return web.json_response(cyclist_report.full())
+
+cyclist_drivers = LoopDrivers(cyclist_memory)
+
+@PromptServer.instance.routes.post("/cyclist/loop_driver/start")
+async def cyclist_loop_driver_start(request):
+    """Body: {"prompt": API format prompt, "client_id", "extra_data", "max_iterations", "time_budget" (seconds),
+    "stop_when": {"loop_id", "var_type", "condition", "value"}}. Driver queues the prompt until any limit is reached."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Body is not JSON"}, status=400)
+    if not isinstance(data, dict) or not isinstance(data.get("prompt"), dict):
+        return web.json_response({"error": "No prompt provided"}, status=400)
+    try:
+        max_iterations = int(data.get("max_iterations", 0))
+        time_budget = float(data.get("time_budget", 0.0))
+    except (TypeError, ValueError):
+        return web.json_response({"error": "max_iterations and time_budget must be numbers"}, status=400)
+    stop_when = data.get("stop_when")
+    if stop_when is not None and not isinstance(stop_when, dict):
+        return web.json_response({"error": "stop_when must be an object"}, status=400)
+    driver = cyclist_drivers.start(data["prompt"],
+                                   extra_data=data.get("extra_data"),
+                                   client_id=data.get("client_id"),
+                                   max_iterations=max_iterations,
+                                   time_budget=time_budget,
+                                   stop_when=stop_when)
+    return web.json_response(driver.status())
+
+@PromptServer.instance.routes.post("/cyclist/loop_driver/stop")
+async def cyclist_loop_driver_stop(request):
     try:
-        for id in dict(reversed(list(cyclist_memory.items()))):
-            memory_content += f"{id}:\n"
-            for vartype in ("INT", "FLOAT", "STRING"):
-                if vartype in cyclist_memory[id] and "value" in cyclist_memory[id][vartype]:
-                    if "counter" in cyclist_memory[id][vartype]:
-                        memory_content += f"(#{cyclist_memory[id][vartype]['counter']})"
-                    memory_content += f"{vartype}: {cyclist_memory[id][vartype]['value']}\n"
-            if "CONDITIONING" in cyclist_memory[id] and "value" in cyclist_memory[id]["CONDITIONING"]:
-                if "counter" in cyclist_memory[id]["CONDITIONING"]:
-                        memory_content += f"(#{cyclist_memory[id]['CONDITIONING']['counter']})"
-                memory_content += "CONDITIONING: -- exists --\n"
-            
-            memory_content += cyclist_file_state(id, "LATENT")
-            memory_content += cyclist_file_state(id, "IMAGE")
-            memory_content += cyclist_file_state(id, "MODEL")
-            
-            #if "LoopTimer" in cyclist_memory[id]:
-            #    memory_content += "Start Timestamp: " + cyclist_memory[id]["LoopTimer"].start_time
-            
-            memory_content += "\n"
-        memory_content = memory_content[0:len(memory_content) - 2]
-    except:
-        memory_content = "-- Memory report failure --"
-        logging.warn("Memory report failed to assemble. Strange, but harmless.")
-    if (memory_content == ""):
-        memory_content = "-- Memory empty --"
-    return memory_content
+        data = await request.json() if request.can_read_body else {}
+    except ValueError:
+        return web.json_response({"error": "Body is not JSON"}, status=400)
+    if not isinstance(data, dict):
+        return web.json_response({"error": "Body must be an object"}, status=400)
+    return web.json_response({"stopped": cyclist_drivers.stop(data.get("driver_id"))})
+
+@PromptServer.instance.routes.get("/cyclist/loop_driver/status")
+async def cyclist_loop_driver_status(request):
+    return web.json_response(cyclist_drivers.status())
     
 class LoopManager:
     """A node to show memory content and to provide a loop id"""
@@ -84,7 +226,8 @@ class LoopManager:
     @classmethod
     def INPUT_TYPES(s):
         return {"required": { "loop_id": ("STRING", {"default": DEFAULT_LOOP_ID}),
-                              "increment": (["never", "by_interrupt_node", "on_any_interrupt"], {"default": "by_interrupt_node"})}}
+                              "increment": (["never", "by_interrupt_node", "on_any_interrupt"], {"default": "by_interrupt_node"})},
+                "hidden": { "unique_id": "UNIQUE_ID"}}
     
     RETURN_TYPES = ("STRING", )
     FUNCTION = "run"
@@ -93,20 +236,23 @@ class LoopManager:
 
     #NODE_NAME = "Loop Manager"
 
-    def run(self, loop_id, increment):
-        memory_content = cyclist_memory_report()
-
+    def run(self, loop_id, increment, unique_id=None):
         global cyclist_memory
+        cyclist_memory.set_active(unique_id, loop_id)
+        cyclist_memory.evict() # Idle loops are checked once per run
+        cyclist_report.mark_dirty(loop_id) # Files of the current loop might be changed by anyone
+        memory_update = cyclist_memory_report()
+
+        memory_extra = ""
         if not loop_id in cyclist_memory:
             filecheck = ""
             filecheck += cyclist_file_state(loop_id, "LATENT")
             filecheck += cyclist_file_state(loop_id, "IMAGE")
             filecheck += cyclist_file_state(loop_id, "MODEL")
             if filecheck != "":
-                memory_content += f"\n\n{loop_id}:\n{filecheck}"
-                memory_content = memory_content[0:len(memory_content) - 1]
+                memory_extra = f"{loop_id}:\n{filecheck}"[:-1]
 
-        return {"ui": {"memory_content": (memory_content,), "increment": (increment, )}, "result": (loop_id,)}
+        return {"ui": {"memory_update": (memory_update,), "memory_extra": (memory_extra,), "increment": (increment, )}, "result": (loop_id,)}
     
 # 'required' input can't be '*', unless it can. Thanks, @pythongossss
 class AnyType(str):
@@ -145,6 +291,9 @@ class CyclistInterrupt:
         print(message)
         PromptServer.instance.send_sync("cyclist.message.popup", {"stop": True, "message" : message})
         nodes.interrupt_processing(True)
+        cyclist_drivers.interrupt()
+        cyclist_flush_models()
+        background_writer.flush_all()
         #logging.info(message)
         #raise Exception(message)
 
@@ -167,10 +316,9 @@ class CyclistRead:
     
     def read(self, loop_id, fallback=None):
         global cyclist_memory
-        if loop_id in cyclist_memory:
-            if self.VAR_TYPE in cyclist_memory[loop_id]:
-                if "value" in cyclist_memory[loop_id][self.VAR_TYPE]:
-                    return (cyclist_memory[loop_id][self.VAR_TYPE]["value"], )
+        if cyclist_memory.has(loop_id, self.VAR_TYPE):
+            with profiler.span(f"{type(self).__name__}.read", loop_id):
+                return (cyclist_memory.get(loop_id, self.VAR_TYPE), )
         if fallback is None:
             err = f"ERROR: No {self.VAR_TYPE} for loop with id={loop_id}, and fallback is not provided."
             print(err)
@@ -182,14 +330,20 @@ class CyclistRead:
     @classmethod
     def IS_CHANGED(self, loop_id, fallback=None):
         global cyclist_memory
-        if loop_id in cyclist_memory:
-            if self.VAR_TYPE in cyclist_memory[loop_id]:
-                if "value" in cyclist_memory[loop_id][self.VAR_TYPE]:
-                    return (cyclist_memory[loop_id][self.VAR_TYPE]["value"], )
+        if cyclist_memory.has(loop_id, self.VAR_TYPE):
+            return (cyclist_memory.get(loop_id, self.VAR_TYPE), )
         if not fallback is None:
             return fallback
         return float("NaN")
 
+def cyclist_memory_updated(loop_id, var_type):
+    """IS_CHANGED result for values too big to be compared: time they were memorized"""
+    global cyclist_memory
+    entry = cyclist_memory.entry(loop_id, var_type)
+    if entry is not None and entry.has_value:
+        return entry.updated
+    return float("NaN")
+
 class CyclistWrite:
     """Base class for saving. All nodes from "Write" inherit it."""
 
@@ -208,29 +362,34 @@ class CyclistWrite:
     @classmethod
     def update(self, loop_id="undefined_loop"):
         global cyclist_memory
-        if not loop_id in cyclist_memory:
-            cyclist_memory[loop_id] = {}
-        if not self.VAR_TYPE in cyclist_memory[loop_id]:
-            cyclist_memory[loop_id][self.VAR_TYPE] = {"counter": 0}
-        
-        cyclist_memory[loop_id][self.VAR_TYPE]["counter"] += 1
+        counter = cyclist_memory.increment(loop_id, self.VAR_TYPE)
+        cyclist_report.mark_dirty(loop_id)
         #PromptServer.instance.send_sync("cyclist.message.counter", {"message" : counter})
         LoopTimer.getLoopTimer(loop_id).report_output_time()
-        return cyclist_memory[loop_id][self.VAR_TYPE]["counter"]
+        cyclist_snapshot.record(loop_id, self.VAR_TYPE)
+        return counter
     
     def write(self, loop_id, to_memory):
         global cyclist_memory
-        if not loop_id in cyclist_memory:
-            cyclist_memory[loop_id] = {}
-        if not self.VAR_TYPE in cyclist_memory[loop_id]:
-            cyclist_memory[loop_id][self.VAR_TYPE] = {"counter": 0}
-        
-        cyclist_memory[loop_id][self.VAR_TYPE]["value"] = to_memory
-        counter = self.update(loop_id)
-        return {"ui": {"loop_id": (loop_id, ), "counter": (counter, ), "memory_content": (cyclist_memory_report(),)}} # and "results": (to_memory, ) ?
-    
+        with profiler.span(f"{type(self).__name__}.write", loop_id):
+            cyclist_memory.put(loop_id, self.VAR_TYPE, to_memory)
+            counter = self.update(loop_id)
+        return {"ui": {"loop_id": (loop_id, ), "counter": (counter, ), "memory_update": (cyclist_memory_report(),)}} # and "results": (to_memory, ) ?
+
+    def submit(self, path, encode, on_done, loop_id, background_write, unique_id, preview):
+        """Hands a file to the background writer. Returns UI preview if the file is already written. Otherwise
+        the preview goes to UI along with "cyclist.writer.done", because the browser can't show a file that isn't there yet."""
+        if background_write:
+            preview = {"node": unique_id, "output": preview} if unique_id is not None else None
+            background_writer.submit(path, encode, on_done, loop_id, self.VAR_TYPE, preview)
+            return {}
+        background_writer.submit(path, encode, on_done, loop_id, self.VAR_TYPE)
+        background_writer.flush(path)
+        cyclist_check_write(loop_id, self.VAR_TYPE)
+        return preview
+
     @classmethod
-    def IS_CHANGED(self, loop_id, to_memory):
+    def IS_CHANGED(self, **kwargs):
         return float("NaN")
       
 #---------- PRIMITIVES ----------
@@ -267,11 +426,76 @@ class RecallInt(CyclistRead):
        result["optional"]["fallback"] = ("INT", {"default": 0, "min": -sys.maxsize, "max": sys.maxsize})
        return result
 
-class MemorizeInt(CyclistWrite):
+class CyclistWriteNumber(CyclistWrite):
+    """Base class for Memorize Int/Float. Besides the value, they keep a history of last values."""
+
+    TYPECODE = "d" # Of history array
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["optional"] = { "history_capacity": ("INT", {"default": HISTORY_CAPACITY, "min": 0, "max": 1000000})}
+       return result
+
+    def write(self, loop_id, to_memory, history_capacity=HISTORY_CAPACITY):
+        global cyclist_memory
+        if history_capacity > 0:
+            history_type = f"{self.VAR_TYPE}_HISTORY"
+            with cyclist_memory.lock:
+                history = cyclist_memory.get(loop_id, history_type)
+                if history is None:
+                    history = ValueHistory(history_capacity, self.TYPECODE)
+                elif history.capacity != history_capacity:
+                    history = history.resized(history_capacity)
+                history.push(to_memory)
+                cyclist_memory.put(loop_id, history_type, history)
+            cyclist_snapshot.record(loop_id, history_type)
+        return super().write(loop_id, to_memory)
+
+class CyclistReadHistory(CyclistRead):
+    """Base class for Recall Int/Float History: a value from history, aggregates of the whole history, and the history itself"""
+
+    RETURN_NAMES = ("value", "min", "max", "mean", "argmax", "history")
+    OUTPUT_IS_LIST = (False, False, False, False, False, True)
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["optional"]["index"] = ("INT", {"default": -1, "min": -1000000, "max": 1000000}) # -1 is the latest value, 0 is the oldest
+       return result
+
+    def read(self, loop_id, index=-1, fallback=None):
+        global cyclist_memory
+        with cyclist_memory.lock:
+            history = cyclist_memory.get(loop_id, f"{self.VAR_TYPE}_HISTORY")
+            if history is not None and len(history) > 0:
+                index = max(-len(history), min(index, len(history) - 1)) # History may be shorter than index yet, in first iterations
+                return (history.get(index), history.minimum(), history.maximum(), history.mean(), history.argmax(), history.to_list())
+        if fallback is None:
+            err = f"ERROR: No {self.VAR_TYPE} history for loop with id={loop_id}, and fallback is not provided."
+            print(err)
+            raise Exception(err)
+
+        self.update()
+        return (fallback, fallback, fallback, float(fallback), 0, [fallback])
+
+    @classmethod
+    def IS_CHANGED(self, loop_id, index=-1, fallback=None):
+        global cyclist_memory
+        with cyclist_memory.lock:
+            history = cyclist_memory.get(loop_id, f"{self.VAR_TYPE}_HISTORY")
+            if history is not None:
+                return (history.pushed, len(history), index)
+        if not fallback is None:
+            return fallback
+        return float("NaN")
+
+class MemorizeInt(CyclistWriteNumber):
     """Node to put an integer number into a global memory"""
 
     #NODE_NAME = "Memorize Int"
     VAR_TYPE = "INT"
+    TYPECODE = "q"
 
     @classmethod
     def INPUT_TYPES(s):
@@ -279,6 +503,19 @@ class MemorizeInt(CyclistWrite):
        result["required"]["to_memory"] = ("INT", {"forceInput": True})
        return result
 
+class RecallIntHistory(CyclistReadHistory):
+    """Node to read last integer numbers memorized for a loop"""
+
+    #NODE_NAME = "Recall Int History"
+    RETURN_TYPES = ("INT", "INT", "INT", "FLOAT", "INT", "INT")
+    VAR_TYPE = "INT"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["optional"]["fallback"] = ("INT", {"default": 0, "min": -sys.maxsize, "max": sys.maxsize})
+       return result
+
 class RecallFloat(CyclistRead):
     """Node to read a float number from a global memory"""
 
@@ -292,7 +529,7 @@ class RecallFloat(CyclistRead):
        result["optional"]["fallback"] = ("FLOAT", {"default": 1.0, "min": -sys.float_info.max, "max": sys.float_info.max})
        return result
 
-class MemorizeFloat(CyclistWrite):
+class MemorizeFloat(CyclistWriteNumber):
     """Node to put a float number into a global memory"""
 
     #NODE_NAME = "Memorize Float"
@@ -304,6 +541,19 @@ class MemorizeFloat(CyclistWrite):
        result["required"]["to_memory"] = ("FLOAT", {"forceInput": True})
        return result
 
+class RecallFloatHistory(CyclistReadHistory):
+    """Node to read last float numbers memorized for a loop"""
+
+    #NODE_NAME = "Recall Float History"
+    RETURN_TYPES = ("FLOAT", "FLOAT", "FLOAT", "FLOAT", "INT", "FLOAT")
+    VAR_TYPE = "FLOAT"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["optional"]["fallback"] = ("FLOAT", {"default": 1.0, "min": -sys.float_info.max, "max": sys.float_info.max})
+       return result
+
 #---------- CONDITIONING ----------
 
 class RecallConditioning(CyclistRead):
@@ -319,6 +569,11 @@ class RecallConditioning(CyclistRead):
        result["optional"]["fallback"] = ("CONDITIONING", )
        return result
     
+    def read(self, loop_id, fallback=None):
+        value = super().read(loop_id, fallback)[0]
+        with profiler.span("RecallConditioning.restore", loop_id):
+            return (restore_value(value), ) # Offloaded tensors go back where they were
+    
     @classmethod
     def IS_CHANGED(self, loop_id, fallback=None):
         return float("NaN") # Conditionings are BIG. It's probably easier to get a new one than compare existing ones
@@ -333,8 +588,15 @@ class MemorizeConditioning(CyclistWrite):
     def INPUT_TYPES(s):
        result = super().INPUT_TYPES()
        result["required"]["to_memory"] = ("CONDITIONING", )
+       result["optional"] = { "offload": (OFFLOAD_MODES, {"default": "none"}),
+                              "offload_dtype": (list(OFFLOAD_DTYPES), {"default": "original"})}
        return result
 
+    def write(self, loop_id, to_memory, offload="none", offload_dtype="original"):
+        with profiler.span("MemorizeConditioning.offload", loop_id):
+            to_memory = offload_value(to_memory, offload, offload_dtype)
+        return super().write(loop_id, to_memory)
+
 #---------- LATENT ----------
 
 class ReloadLatent(CyclistRead):
@@ -355,18 +617,22 @@ class ReloadLatent(CyclistRead):
         return os.path.join(folder_paths.get_output_directory(), 'latents')
 
     def read(self, filename, fallback=None):
+        loop_id = filename
         subfolder = os.path.dirname(os.path.normpath(filename))
         folder = os.path.join(ReloadLatent.GET_DIR(), subfolder)
         filename = os.path.basename(os.path.normpath(filename))
         filename = f"{filename}.latent"
         full_filepath = os.path.join(folder, filename)
+        background_writer.flush(full_filepath)
+        cyclist_check_write(loop_id, OverrideLatent.VAR_TYPE, fallback is not None)
 
         try:
-            latent = safetensors.torch.load_file(full_filepath, device="cpu")
-            multiplier = 1.0
-            if "latent_format_version_0" not in latent:
-                multiplier = 1.0 / 0.18215
-            samples = {"samples": latent["latent_tensor"].float() * multiplier}
+            latent_tensor = decoded_cache.get(full_filepath)
+            if latent_tensor is None:
+                with profiler.span("ReloadLatent.decode", filename):
+                    latent_tensor = load_latent(full_filepath)
+                decoded_cache.put(full_filepath, latent_tensor)
+            samples = {"samples": latent_tensor.clone()} # Cached tensor must not be changed in place by whatever comes next
         except:
             if fallback is None:
                 err = f"ERROR: Can't load latent file, and fallback is not provided. \nLoad path: {full_filepath}"
@@ -384,13 +650,11 @@ class ReloadLatent(CyclistRead):
         filename = os.path.basename(os.path.normpath(filename))
         filename = f"{filename}.latent"
         full_filepath = os.path.join(folder, filename)
-        try:
-            m = hashlib.sha256()
-            with open(full_filepath, 'rb') as f:
-                m.update(f.read())
-            return m.digest().hex()
-        except:
+        background_writer.flush(full_filepath)
+        fingerprint = file_fingerprint(full_filepath)
+        if fingerprint is None:
             return float("NaN")
+        return fingerprint
 
 class OverrideLatent(CyclistWrite):
     """Node to save latent to a file, overriding if need to.""" # Mostly copy-pasted SaveLatent
@@ -399,7 +663,8 @@ class OverrideLatent(CyclistWrite):
     def INPUT_TYPES(s):
         return {"required": { "filename": ("STRING", {"default": DEFAULT_LOOP_ID}), 
                               "samples": ("LATENT", ),},
-                "hidden": { "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
+                "optional": { "background_write": ("BOOLEAN", {"default": True})},
+                "hidden": { "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO", "unique_id": "UNIQUE_ID"},
                 }
     
     #NODE_NAME = "Save Latent (Override)"
@@ -409,7 +674,7 @@ class OverrideLatent(CyclistWrite):
     def GET_DIR(self):
         return os.path.join(folder_paths.get_output_directory(), 'latents')
     
-    def write(self, filename, samples, prompt=None, extra_pnginfo=None):
+    def write(self, filename, samples, background_write=True, prompt=None, extra_pnginfo=None, unique_id=None):
         loop_id = filename
 
         subfolder = os.path.dirname(os.path.normpath(filename))
@@ -439,13 +704,55 @@ class OverrideLatent(CyclistWrite):
         if not os.path.exists(folder):
             os.makedirs(folder, exist_ok=True)
 
+        with profiler.span("OverrideLatent.copy", loop_id):
+            latent = samples["samples"].detach().to("cpu", copy=True) # The workflow goes on while it's being saved
         output = {}
-        output["latent_tensor"] = samples["samples"]
+        output["latent_tensor"] = latent
         output["latent_format_version_0"] = torch.tensor([])
-        comfy.utils.save_torch_file(output, full_filepath, metadata=metadata)
 
+        def encode(path):
+            comfy.utils.save_torch_file(output, path, metadata=metadata)
+
+        def on_done(path):
+            # Next Reload Latent would get exactly the same thing from this file, so let it skip the parsing
+            decoded_cache.put(path, latent.float())
+
+        results = self.submit(full_filepath, encode, on_done, loop_id, background_write, unique_id, {"latents": results})
         counter = self.update(loop_id)
-        return { "ui": { "latents": results, "loop_id": (loop_id, ), "counter": (counter, ), "memory_content": (cyclist_memory_report(),)} }
+        return { "ui": dict(results, loop_id=(loop_id, ), counter=(counter, ), memory_update=(cyclist_memory_report(),)) }
+
+class RecallLatent(CyclistRead):
+    """Node to read a latent from a global memory. Unlike Reload Latent, there are no files involved."""
+
+    #NODE_NAME = "Recall Latent"
+    RETURN_TYPES = ("LATENT", )
+    VAR_TYPE = "LATENT"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["optional"]["fallback"] = ("LATENT", )
+       return result
+
+    @classmethod
+    def IS_CHANGED(self, loop_id, fallback=None):
+        return cyclist_memory_updated(loop_id, self.VAR_TYPE)
+
+class MemorizeLatent(CyclistWrite):
+    """Node to put a latent into a global memory"""
+
+    #NODE_NAME = "Memorize Latent"
+    VAR_TYPE = "LATENT"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["required"]["to_memory"] = ("LATENT", )
+       result["optional"] = { "placement": (MEMORY_PLACEMENTS, {"default": "original"})}
+       return result
+
+    def write(self, loop_id, to_memory, placement="original"):
+        return super().write(loop_id, place_value(to_memory, placement))
 
 #---------- IMAGE ----------
 
@@ -457,6 +764,8 @@ class ReloadImage(CyclistRead):
        result = super().INPUT_TYPES()
        result["required"]["filename"] = result["required"].pop("loop_id")
        result["optional"]["fallback"] = ("IMAGE",)
+       result["optional"]["batch_index"] = ("INT", {"default": -1, "min": -1, "max": 4096}) # -1 is the whole batch
+       result["optional"]["channels"] = (["RGBA", "RGB"], {"default": "RGBA"})
        return result
     
     RETURN_TYPES = ("IMAGE", )
@@ -466,47 +775,69 @@ class ReloadImage(CyclistRead):
     def GET_DIR(self):
         return folder_paths.get_output_directory()
 
-    def read(self, filename, fallback=None):
+    @classmethod
+    def GET_FILEPATH(self, filename):
+        """Path to an image of any supported format, whichever was saved last"""
         subfolder = os.path.dirname(os.path.normpath(filename))
         folder = os.path.join(ReloadImage.GET_DIR(), subfolder)
         filename = os.path.basename(os.path.normpath(filename))
-        filename = f"{filename}.png"
-        full_filepath = os.path.join(folder, filename)
+        result = os.path.join(folder, f"{filename}.png")
+        latest = None
+        for extension in IMAGE_EXTENSIONS:
+            full_filepath = os.path.join(folder, f"{filename}{extension}")
+            background_writer.flush(full_filepath)
+            try:
+                mtime = os.path.getmtime(full_filepath)
+            except OSError:
+                continue
+            if latest is None or mtime > latest:
+                latest = mtime
+                result = full_filepath
+        return result
+
+    def read(self, filename, fallback=None, batch_index=-1, channels="RGBA"):
+        full_filepath = ReloadImage.GET_FILEPATH(filename)
+        cyclist_check_write(filename, OverrideImage.VAR_TYPE, fallback is not None)
 
         try:
-            image = Image.open(full_filepath)
-            if getattr(image, "is_animated", False):
-                image = image.seek(0) # No animation support so far.
-            i = ImageOps.exif_transpose(image)
-            if i.mode == 'I':
-                i = i.point(lambda i: i * (1 / 255))
-            image = i.convert("RGBA")
-            image = np.array(image).astype(np.float32) / 255.0
-            image = torch.from_numpy(image)[None,]
+            pixels = decoded_cache.get(full_filepath)
+            if pixels is None:
+                with profiler.span("ReloadImage.decode", filename):
+                    pixels = decode_pixels(full_filepath)
+                decoded_cache.put(full_filepath, pixels)
+            batch = pixels
         except:
             if fallback is None:
                 err = f"ERROR: Can't load image file, and fallback is not provided. \nLoad path: {full_filepath}"
                 print(err)
                 raise Exception(err)
-            image = torch.unsqueeze(fallback[0], 0) # Remake batch with only 1st image
+            pixels = None
+            batch = fallback
+
+        if batch_index >= 0:
+            if batch_index >= batch.size()[0]:
+                err = f"ERROR: Image batch has only {batch.size()[0]} images, can't take one with batch_index={batch_index}."
+                print(err)
+                raise Exception(err)
+            batch = batch[batch_index:batch_index + 1]
+
+        if pixels is not None:
+            image = pixels_to_image(batch, channels=len(channels)) # Only the picked images are converted to float
+        elif channels == "RGB":
+            image = batch[..., :3]
+        else:
+            image = batch
         
         self.update()
         return (image, )
 
     @classmethod
-    def IS_CHANGED(self, filename, fallback=None):
-        subfolder = os.path.dirname(os.path.normpath(filename))
-        folder = os.path.join(ReloadImage.GET_DIR(), subfolder)
-        filename = os.path.basename(os.path.normpath(filename))
-        filename = f"{filename}.png"
-        full_filepath = os.path.join(folder, filename)
-        try:
-            m = hashlib.sha256()
-            with open(full_filepath, 'rb') as f:
-                m.update(f.read())
-            return m.digest().hex()
-        except:
+    def IS_CHANGED(self, filename, fallback=None, batch_index=-1, channels="RGBA"):
+        full_filepath = ReloadImage.GET_FILEPATH(filename)
+        fingerprint = file_fingerprint(full_filepath)
+        if fingerprint is None:
             return float("NaN")
+        return fingerprint
       
 class OverrideImage(CyclistWrite):
     """Node to save image to a file, overriding if need to.""" # Mostly copy-pasted SaveImage
@@ -515,7 +846,9 @@ class OverrideImage(CyclistWrite):
     def INPUT_TYPES(s):
         return {"required": { "filename": ("STRING", {"default": DEFAULT_LOOP_ID}), 
                               "image": ("IMAGE", ),},
-                "hidden": { "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
+                "optional": { "background_write": ("BOOLEAN", {"default": True}),
+                              "image_format": (list(IMAGE_FORMATS.keys()), {"default": "png"})},
+                "hidden": { "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO", "unique_id": "UNIQUE_ID"},
                 }
     
     #NODE_NAME = "Save Image (Override)"
@@ -525,41 +858,82 @@ class OverrideImage(CyclistWrite):
     def GET_DIR(self):
         return folder_paths.get_output_directory()
     
-    def write(self, filename, image, prompt=None, extra_pnginfo=None):
+    def write(self, filename, image, background_write=True, image_format="png", prompt=None, extra_pnginfo=None, unique_id=None):
         loop_id = filename
 
         subfolder = os.path.dirname(os.path.normpath(filename))
         folder = os.path.join(OverrideImage.GET_DIR(), subfolder)
         filename = os.path.basename(os.path.normpath(filename))
-        filename = f"{filename}.png"
+        filename = f"{filename}{IMAGE_FORMATS[image_format]}"
         full_filepath = os.path.join(folder, filename)
 
-        image = image[0] # Take 1st from batch. Other CyclistWrite nodes have no batch support - why this should?
-        i = 255. * image.cpu().numpy()
-        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+        with profiler.span("OverrideImage.convert", loop_id):
+            i = 255. * image.cpu().numpy() # Whole batch goes to one file
+            pixels = np.clip(i, 0, 255).astype(np.uint8)
 
         metadata = None
         if not args.disable_metadata:
-            metadata = PngInfo()
+            metadata = {}
             if prompt is not None:
-                metadata.add_text("prompt", json.dumps(prompt))
+                metadata["prompt"] = json.dumps(prompt)
             if extra_pnginfo is not None:
                 for x in extra_pnginfo:
-                    metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+                    metadata[x] = json.dumps(extra_pnginfo[x])
 
         results = list()
-        results.append({
-            "filename": filename,
-            "subfolder": subfolder,
-            "type": "output"
-        })
+        if image_format != "raw": # Browser can't show raw pixels
+            results.append({
+                "filename": filename,
+                "subfolder": subfolder,
+                "type": "output"
+            })
 
         if not os.path.exists(folder):
             os.makedirs(folder, exist_ok=True)
-        img.save(full_filepath, pnginfo=metadata, compress_level=4)
-        
+
+        def encode(path):
+            encode_image(path, pixels, image_format, metadata)
+
+        def on_done(path):
+            # Same pixels Reload Image would decode from this file
+            decoded_cache.put(path, torch.from_numpy(pixels))
+
+        results = self.submit(full_filepath, encode, on_done, loop_id, background_write, unique_id, {"images": results})
         counter = self.update(loop_id)
-        return { "ui": { "images": results, "loop_id": (loop_id, ), "counter": (counter, ), "memory_content": (cyclist_memory_report(),)} }
+        return { "ui": dict(results, loop_id=(loop_id, ), counter=(counter, ), memory_update=(cyclist_memory_report(),)) }
+
+class RecallImage(CyclistRead):
+    """Node to read an image batch from a global memory. Unlike Reload Image, there are no files involved."""
+
+    #NODE_NAME = "Recall Image"
+    RETURN_TYPES = ("IMAGE", )
+    VAR_TYPE = "IMAGE"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["optional"]["fallback"] = ("IMAGE", )
+       return result
+
+    @classmethod
+    def IS_CHANGED(self, loop_id, fallback=None):
+        return cyclist_memory_updated(loop_id, self.VAR_TYPE)
+
+class MemorizeImage(CyclistWrite):
+    """Node to put an image batch into a global memory"""
+
+    #NODE_NAME = "Memorize Image"
+    VAR_TYPE = "IMAGE"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       result = super().INPUT_TYPES()
+       result["required"]["to_memory"] = ("IMAGE", )
+       result["optional"] = { "placement": (MEMORY_PLACEMENTS, {"default": "original"})}
+       return result
+
+    def write(self, loop_id, to_memory, placement="original"):
+        return super().write(loop_id, place_value(to_memory, placement))
 
 #---------- Model ----------
 
@@ -581,28 +955,50 @@ class ReloadModel(CyclistRead):
         try:
             subfolder = os.path.dirname(os.path.normpath(filename))
             filename = os.path.basename(os.path.normpath(filename))
-            filename = f"{filename}.safetensors"
 
             dirs = folder_names_and_paths["checkpoints"][0]
             for dir in dirs:
                 folder = os.path.join(dir, subfolder)
-                full_filepath = os.path.join(folder, filename)
-                if os.path.isfile(full_filepath):
-                    return dir
+                for extension in (".safetensors", DELTA_MANIFEST_EXTENSION):
+                    full_filepath = os.path.join(folder, f"{filename}{extension}")
+                    if os.path.isfile(full_filepath):
+                        return dir
             return dirs[0]
         except:
             result = folder_paths.get_output_directory()
             return result
 
-    def read(self, filename, fallback_m=None, fallback_c=None, fallback_v=None):
+    @classmethod
+    def GET_FILEPATH(self, filename):
+        """Path to a full checkpoint or to a delta manifest, whichever was saved last"""
         subfolder = os.path.dirname(os.path.normpath(filename))
         folder = os.path.join(ReloadModel.GET_DIR(filename), subfolder)
         filename = os.path.basename(os.path.normpath(filename))
-        filename = f"{filename}.safetensors"
-        full_filepath = os.path.join(folder, filename)
+        checkpoint_filepath = os.path.join(folder, f"{filename}.safetensors")
+        manifest_filepath = os.path.join(folder, f"{filename}{DELTA_MANIFEST_EXTENSION}")
+        background_writer.flush(checkpoint_filepath)
+        background_writer.flush(manifest_filepath)
+        if os.path.isfile(manifest_filepath):
+            if not os.path.isfile(checkpoint_filepath) or os.path.getmtime(manifest_filepath) > os.path.getmtime(checkpoint_filepath):
+                return manifest_filepath
+        return checkpoint_filepath
+
+    def read(self, filename, fallback_m=None, fallback_c=None, fallback_v=None):
+        full_filepath = ReloadModel.GET_FILEPATH(filename)
+        cyclist_check_write(filename, OverrideModel.VAR_TYPE, any(f is not None for f in (fallback_m, fallback_c, fallback_v)))
 
         try:
-            result = comfy.sd.load_checkpoint_guess_config(full_filepath, output_vae=True, output_clip=True, embedding_directory=folder_paths.get_folder_paths("embeddings"))
+            fingerprint = file_fingerprint(full_filepath)
+            result = checkpoint_cache.get(full_filepath, fingerprint)
+            if result is None:
+                embedding_directory = folder_paths.get_folder_paths("embeddings")
+                with profiler.span("ReloadModel.load", filename):
+                    if full_filepath.endswith(DELTA_MANIFEST_EXTENSION):
+                        state_dict, metadata = load_delta_checkpoint(full_filepath)
+                        result = comfy.sd.load_state_dict_guess_config(state_dict, output_vae=True, output_clip=True, embedding_directory=embedding_directory)[:3]
+                    else:
+                        result = comfy.sd.load_checkpoint_guess_config(full_filepath, output_vae=True, output_clip=True, embedding_directory=embedding_directory)[:3]
+                checkpoint_cache.put(full_filepath, fingerprint, result)
         except:
             msg = f"WARNING: Can't load model file. "
             if fallback_m is None:
@@ -619,19 +1015,12 @@ class ReloadModel(CyclistRead):
         return result[:3]
 
     @classmethod
-    def IS_CHANGED(self, filename, fallback=None):
-        subfolder = os.path.dirname(os.path.normpath(filename))
-        folder = os.path.join(ReloadModel.GET_DIR(filename), subfolder)
-        filename = os.path.basename(os.path.normpath(filename))
-        filename = f"{filename}.safetensors"
-        full_filepath = os.path.join(folder, filename)
-        try:
-            m = hashlib.sha256()
-            with open(full_filepath, 'rb') as f:
-                m.update(f.read())
-            return m.digest().hex()
-        except:
+    def IS_CHANGED(self, filename, **kwargs): # Fallbacks are fallback_m, fallback_c and fallback_v
+        full_filepath = ReloadModel.GET_FILEPATH(filename)
+        fingerprint = file_fingerprint(full_filepath)
+        if fingerprint is None:
             return float("NaN")
+        return fingerprint
 
 class OverrideModel(CyclistWrite):
     """Node to save model to a file, overriding if need to.""" # Mostly copy-pasted save_checkpoint()
@@ -642,6 +1031,8 @@ class OverrideModel(CyclistWrite):
                               "model": ("MODEL",),
                               "clip": ("CLIP",),
                               "vae": ("VAE",)},
+                "optional": { "background_write": ("BOOLEAN", {"default": False}),
+                              "save_format": (["checkpoint", "delta"], {"default": "checkpoint"})},
                 "hidden": { "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
                 }
     
@@ -657,13 +1048,23 @@ class OverrideModel(CyclistWrite):
             result = folder_paths.get_output_directory()
             return result
     
-    def write(self, filename, model, clip, vae, prompt=None, extra_pnginfo=None):
+    def write(self, filename, model, clip, vae, background_write=False, save_format="checkpoint", prompt=None, extra_pnginfo=None):
         loop_id = filename
+        OverrideModel.save(filename, model, clip, vae, prompt, extra_pnginfo, background=background_write, save_format=save_format)
+
+        counter = self.update(loop_id)
+        return {"ui": {"loop_id": (loop_id, ), "counter": (counter, ), "memory_update": (cyclist_memory_report(),)}}
 
+    @classmethod
+    def save(self, filename, model, clip, vae, prompt=None, extra_pnginfo=None, background=False, save_format="checkpoint"):
+        loop_id = filename
         subfolder = os.path.dirname(os.path.normpath(filename))
         folder = os.path.join(OverrideModel.GET_DIR(), subfolder)
         filename = os.path.basename(os.path.normpath(filename))
-        filename = f"{filename}.safetensors"
+        if save_format == "delta":
+            filename = f"{filename}{DELTA_MANIFEST_EXTENSION}"
+        else:
+            filename = f"{filename}.safetensors"
         full_filepath = os.path.join(folder, filename)
 
         prompt_info = ""
@@ -696,10 +1097,132 @@ class OverrideModel(CyclistWrite):
                 for x in extra_pnginfo:
                     metadata[x] = json.dumps(extra_pnginfo[x])
 
-        comfy.sd.save_checkpoint(full_filepath, model, clip, vae, clip_vision=None, metadata=metadata)
+        on_done = None
+        if save_format == "delta":
+            # Only tensors that changed since any previous save are written. Hashing needs them on CPU anyway
+            state_dict = checkpoint_state_dict(model, clip, vae)
+            def encode(path):
+                written = save_delta_checkpoint(path, state_dict, metadata)
+                logging.info(f"Cyclist: delta checkpoint {full_filepath} is saved, {written / 2**20:.1f} MB of changed tensors written")
+            def on_done(path):
+                collect_garbage(folder)
+        elif background:
+            # Patched weights may change as soon as the workflow goes on, so the background thread gets a copy
+            state_dict = checkpoint_state_dict(model, clip, vae)
+            def encode(path):
+                comfy.utils.save_torch_file(state_dict, path, metadata=metadata)
+        else:
+            def encode(path):
+                comfy.sd.save_checkpoint(path, model, clip, vae, clip_vision=None, metadata=metadata)
+
+        background_writer.submit(full_filepath, encode, on_done, loop_id, self.VAR_TYPE)
+        if not background:
+            background_writer.flush(full_filepath)
+        return full_filepath
+
+def checkpoint_state_dict(model, clip, vae):
+    """Same state dict comfy.sd.save_checkpoint() writes, but copied to CPU"""
+    clip_sd = None
+    load_models = [model]
+    if clip is not None:
+        load_models.append(clip.load_model())
+        clip_sd = clip.get_sd()
+    vae_sd = None
+    if vae is not None:
+        vae_sd = vae.get_sd()
+    comfy.model_management.load_models_gpu(load_models, force_patch_weights=True)
+    state_dict = model.model.state_dict_for_saving(clip_sd, vae_sd, None)
+    return {k: t.detach().to("cpu", copy=True).contiguous() for k, t in state_dict.items()}
+
+class RecallModel(CyclistRead):
+    """Node to read a model, CLIP and VAE from a global memory"""
 
+    #NODE_NAME = "Recall Model"
+    RETURN_TYPES = ("MODEL", "CLIP", "VAE", )
+    VAR_TYPE = "MODEL"
+
+    @classmethod
+    def INPUT_TYPES(s):
+       return { "required": { "loop_id": ("STRING", {"default": DEFAULT_LOOP_ID})}, 
+                "optional": { "fallback_m": ("MODEL", ),
+                              "fallback_c": ("CLIP", ),
+                              "fallback_v": ("VAE", )}, }
+
+    def read(self, loop_id, fallback_m=None, fallback_c=None, fallback_v=None):
+        global cyclist_memory
+        stored = cyclist_memory.get(loop_id, self.VAR_TYPE, (None, None, None))
+        result = tuple(s if s is not None else f for s, f in zip(stored, (fallback_m, fallback_c, fallback_v)))
+        if all(r is None for r in result):
+            err = f"ERROR: No {self.VAR_TYPE} for loop with id={loop_id}, and fallback is not provided."
+            print(err)
+            raise Exception(err)
+
+        self.update()
+        return result
+
+    @classmethod
+    def IS_CHANGED(self, loop_id, fallback_m=None, fallback_c=None, fallback_v=None):
+        return float("NaN") # Models are even bigger than conditionings
+
+cyclist_model_flushes = {} # loop_id -> (prompt, extra_pnginfo) of models memorized, but not saved to a file yet
+
+def cyclist_forget_loop(loop_id):
+    """Called for every loop evicted from memory"""
+    global cyclist_model_flushes
+    if cyclist_model_flushes.pop(loop_id, None) is not None:
+        logging.warning(f"Cyclist: memorized model of loop with id={loop_id} is evicted before it was saved")
+    cyclist_snapshot.forget(loop_id)
+    cyclist_report.mark_dirty(loop_id)
+
+cyclist_memory.on_evict = cyclist_forget_loop
+
+def cyclist_flush_models():
+    """Saves every memorized model that waits for a flush on interrupt"""
+    global cyclist_model_flushes
+    for loop_id, (prompt, extra_pnginfo) in list(cyclist_model_flushes.items()):
+        MemorizeModel.flush(loop_id, prompt, extra_pnginfo)
+
+class MemorizeModel(CyclistWrite):
+    """Node to put a model, CLIP and VAE into a global memory. They can also be flushed to a file, same one Save Model (Override) uses."""
+
+    #NODE_NAME = "Memorize Model"
+    VAR_TYPE = "MODEL"
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": { "loop_id": ("STRING", {"default": DEFAULT_LOOP_ID}), 
+                              "model": ("MODEL",)},
+                "optional": { "clip": ("CLIP",),
+                              "vae": ("VAE",),
+                              "flush_every": ("INT", {"default": 0, "min": 0, "max": sys.maxsize}),
+                              "flush_on_interrupt": ("BOOLEAN", {"default": True})},
+                "hidden": { "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
+                }
+
+    def write(self, loop_id, model, clip=None, vae=None, flush_every=0, flush_on_interrupt=True, prompt=None, extra_pnginfo=None):
+        global cyclist_memory, cyclist_model_flushes
+        cyclist_memory.put(loop_id, self.VAR_TYPE, (model, clip, vae), size=0) # Weights are ComfyUI's model manager business, not memory budget's
         counter = self.update(loop_id)
-        return {"ui": {"loop_id": (loop_id, ), "counter": (counter, ), "memory_content": (cyclist_memory_report(),)}}
+
+        if flush_every > 0 and counter % flush_every == 0:
+            MemorizeModel.flush(loop_id, prompt, extra_pnginfo)
+        elif flush_on_interrupt:
+            cyclist_model_flushes[loop_id] = (prompt, extra_pnginfo)
+        else:
+            cyclist_model_flushes.pop(loop_id, None)
+
+        return {"ui": {"loop_id": (loop_id, ), "counter": (counter, ), "memory_update": (cyclist_memory_report(),)}}
+
+    @classmethod
+    def flush(self, loop_id, prompt=None, extra_pnginfo=None):
+        global cyclist_memory, cyclist_model_flushes
+        cyclist_model_flushes.pop(loop_id, None)
+        try:
+            model, clip, vae = cyclist_memory.get(loop_id, self.VAR_TYPE)
+            full_filepath = OverrideModel.save(loop_id, model, clip, vae, prompt, extra_pnginfo, background=True)
+            logging.info(f"Cyclist: memorized model is being saved to {full_filepath}")
+        except Exception as e:
+            logging.warning(f"Cyclist: failed to save memorized model for loop with id={loop_id}: {e}")
 
 # Not implemented yet, because CLIP object can actually consist of several CLIPs, and it (probably) requires to save/load using several files
 """
@@ -757,13 +1280,10 @@ class ReloadCLIP(CyclistRead):
         filename = os.path.basename(os.path.normpath(filename))
         filename = f"{filename}.safetensors"
         full_filepath = os.path.join(folder, filename)
-        try:
-            m = hashlib.sha256()
-            with open(full_filepath, 'rb') as f:
-                m.update(f.read())
-            return m.digest().hex()
-        except:
+        fingerprint = file_fingerprint(full_filepath)
+        if fingerprint is None:
             return float("NaN")
+        return fingerprint
 
 class OverrideCLIP(CyclistWrite):
     #Node to save CLIP to a file, overriding if need to. # Mostly copy-pasted CLIPSave
@@ -829,39 +1349,144 @@ class OverrideCLIP(CyclistWrite):
         return {}
     """
 
+class CyclistProfiler:
+    """Node to turn on profiling of Cyclist work. Every iteration is saved as a Chrome trace into "output/.cyclist_profile",
+    and the summary shows p50/p95 time of every kind of work over recent iterations."""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return { "required": { "enabled": ("BOOLEAN", {"default": True}),
+                               "loop_id": ("STRING", {"default": DEFAULT_LOOP_ID})}}
+
+    RETURN_TYPES = ("STRING", )
+    RETURN_NAMES = ("summary", )
+    FUNCTION = "report"
+    OUTPUT_NODE = True
+    CATEGORY = "cyclist/Utilities"
+
+    #NODE_NAME = "Cyclist Profiler"
+
+    def report(self, enabled, loop_id):
+        summary = profiler.summary()
+        return {"ui": {"text": (summary, )}, "result": (summary, )}
+
+    @classmethod
+    def IS_CHANGED(self, enabled, loop_id):
+        # Called before any node of the prompt runs, so this is where one iteration ends and another begins
+        profiler.next_iteration(enabled, loop_id)
+        return float("NaN")
+
+CONVERGENCE_THUMBNAIL_SIZE = 64 # Images and latents are compared by thumbnails of that size, not in full resolution
+
+def convergence_thumbnail(tensor, latent):
+    """Grayscale thumbnails [N, size, size] of an image or latent batch, in float16 on CPU.
+    Extra dimensions (frames of video latents) are folded into the batch."""
+    x = tensor.detach()
+    if x.dim() == 3:
+        x = x[None,]
+    if latent:
+        x = x.movedim(1, -3) # [B, C, (T,) H, W] -> [B, (T,) C, H, W]
+    else:
+        x = x[..., :3].movedim(-1, -3) # [B, H, W, C] -> [B, C, H, W]
+    x = x.reshape(-1, *x.size()[-3:])
+    x = torch.nn.functional.adaptive_avg_pool2d(x.float(), CONVERGENCE_THUMBNAIL_SIZE) # Downsampled before channels are mixed or anything is copied
+    return x.mean(dim=1).to("cpu", torch.float16)
+
+def convergence_distance(a, b, metric):
+    """Distance between two thumbnail batches, the biggest among batch items. Hamming is a share of differing hash bits, from 0 to 1."""
+    a = a.float().reshape(a.size()[0], -1)
+    b = b.float().reshape(b.size()[0], -1)
+    if metric == "hamming":
+        bits_a = a > a.median(dim=1, keepdim=True).values
+        bits_b = b > b.median(dim=1, keepdim=True).values
+        return (bits_a != bits_b).float().mean(dim=1).max().item()
+    return (a - b).square().mean(dim=1).sqrt().max().item()
+
+class CyclistConvergence:
+    """Checks if a loop has converged: last iterations produced (almost) the same image or latent. Also catches oscillation,
+    when the result keeps returning to one of previous iterations. Thumbnails of previous iterations are kept in memory by loop id."""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return { "required": { "anything": (AnyType("*"), ),
+                               "loop_id": ("STRING", {"default": DEFAULT_LOOP_ID}),
+                               "metric": (["hamming", "l2"], {"default": "hamming"}),
+                               "threshold": ("FLOAT", {"default": 0.02, "min": 0.0, "max": sys.float_info.max, "step": 0.001, "round": False}),
+                               "iterations": ("INT", {"default": 3, "min": 1, "max": 100})}}
+
+    RETURN_TYPES = ("BOOLEAN", "BOOLEAN", "BOOLEAN", "FLOAT")
+    RETURN_NAMES = ("stop", "converged", "oscillating", "distance")
+    FUNCTION = "check"
+    CATEGORY = "cyclist/Utilities"
+
+    #NODE_NAME = "Convergence Check"
+    VAR_TYPE = "CONVERGENCE"
+
+    def check(self, anything, loop_id, metric, threshold, iterations):
+        global cyclist_memory
+        tensor = as_tensor(anything)
+        if tensor is None:
+            raise Exception("Convergence Check needs an image or a latent")
+        thumbnail = convergence_thumbnail(tensor, latent=isinstance(anything, dict)) # Channel count can't tell: SD3/Flux latents have 16
+
+        with cyclist_memory.lock:
+            history = list(cyclist_memory.get(loop_id, self.VAR_TYPE, []))
+            history = [h for h in history if h.size() == thumbnail.size()] # Size changed, previous iterations are not comparable
+            history = (history + [thumbnail])[-(iterations + 1):]
+            cyclist_memory.put(loop_id, self.VAR_TYPE, history)
+        cyclist_snapshot.record(loop_id, self.VAR_TYPE)
+
+        # Distances from the newest thumbnail to every previous one, the latest first
+        distances = [convergence_distance(thumbnail, h, metric) for h in reversed(history[:-1])]
+        distance = distances[0] if distances else float("inf")
+        steps = [convergence_distance(history[i], history[i + 1], metric) for i in range(len(history) - 1)]
+        converged = len(steps) >= iterations and all(d <= threshold for d in steps)
+        oscillating = distance > threshold and any(d <= threshold for d in distances[1:])
+        return (converged or oscillating, converged, oscillating, distance)
+
+    @classmethod
+    def IS_CHANGED(self, **kwargs):
+        return float("NaN") # Every iteration has to be counted
+
 # TODO: Move Timer to util_nodes.py
 class CyclistTimer:
-    """Measures the time of the last generation, and sum of them all during session"""
+    """Measures the time of the last generation, and sum of them all during session.
+    Also gives statistics of generation times, and tells if one more generation fits into the time budget (in the same units as the rest)."""
 
     @classmethod
     def INPUT_TYPES(s):
         return { "required":{ "loop_id": ("STRING", {"default": DEFAULT_LOOP_ID}),
-                              "mode": (["hours", "minutes", "seconds", "milliseconds"], {"default" : "seconds"})} }
+                              "mode": (["hours", "minutes", "seconds", "milliseconds"], {"default" : "seconds"})},
+                 "optional":{ "budget": ("FLOAT", {"default": 0.0, "min": 0.0, "max": sys.float_info.max, "step": 0.1, "round": False})} }
     
-    RETURN_TYPES = ("FLOAT", "FLOAT")
-    RETURN_NAMES = ("last gen time", "total loop time")
+    RETURN_TYPES = ("FLOAT", "FLOAT", "FLOAT", "FLOAT", "FLOAT", "FLOAT", "FLOAT", "BOOLEAN", "FLOAT")
+    RETURN_NAMES = ("last gen time", "total loop time", "mean gen time", "std dev", "ewma gen time", "p95 gen time", "gens per minute", "next fits budget", "budget left")
     FUNCTION = "run"
     CATEGORY = "cyclist/Utilities"
 
     #NODE_NAME = "Generation Timer"
 
-    def run(self, loop_id, mode):
-        last, total = LoopTimer.getLoopTimer(loop_id).getIntervals()
-        
-        if (mode == "hours"):
-            last = last / 3600
-            total = total / 3600
-        elif (mode == "minutes"):
-            last = last / 60
-            total = total / 60
-        elif (mode == "milliseconds"):
-            last = last * 1000
-            total = total * 1000
+    def run(self, loop_id, mode, budget=0.0):
+        timer = LoopTimer.getLoopTimer(loop_id)
+        last, total = timer.getIntervals()
+        stats = timer.stats
+        scale = {"hours": 1 / 3600, "minutes": 1 / 60, "seconds": 1.0, "milliseconds": 1000.0}[mode]
+        last = last * scale
+        total = total * scale
+
+        next_time = stats.predict_next() * scale
+        if budget > 0:
+            budget_left = budget - total
+            fits = next_time <= budget_left
+        else:
+            budget_left = float("inf")
+            fits = True
         PromptServer.instance.send_sync("cyclist.timer.update", {"loop_id": loop_id, "last_time" : last, "total_time": total, "mode": mode})
-        return (last, total)
+        return (last, total, stats.mean * scale, stats.std() * scale, stats.ewma * scale, stats.quantile.value() * scale,
+                stats.iterations_per_minute(), fits, budget_left)
 
     @classmethod
-    def IS_CHANGED(self, loop_id, mode):
+    def IS_CHANGED(self, loop_id, mode, budget=0.0):
         if (loop_id):
             LoopTimer.getLoopTimer(loop_id).reset()
         return float("NaN")
@@ -894,22 +1519,20 @@ class LoopTimer:
         self.is_summed_this_run = False
         self.is_stopped_this_run = False
         self.is_force_stopped = False
+        self.stats = IterationStats()
 
     @classmethod
     def getLoopTimer(self, loop_id):
-        if loop_id in cyclist_memory:
-            if "LoopTimer" in cyclist_memory[loop_id]:
-                return cyclist_memory[loop_id]["LoopTimer"]
-        new_timer = LoopTimer()
         if not loop_id in cyclist_memory:
-            cyclist_memory[loop_id] = {}
-        cyclist_memory[loop_id]["LoopTimer"] = new_timer
-        return new_timer
+            cyclist_report.mark_dirty(loop_id)
+        return cyclist_memory.timer(loop_id, LoopTimer)
 
     def getIntervals(self):
         return_last = self.last_interval
         if not self.is_summed_this_run:
             self.total_intervals += self.last_interval
+            if self.last_interval > 0:
+                self.stats.add(self.last_interval)
             if self.is_stopped_this_run:
                 # Rare case: Something was saved before Timer procs
                 return_last = self.stored_interval
@@ -931,4 +1554,14 @@ class LoopTimer:
             else:
                 # Rare case: Something was saved before Timer procs
                 self.stored_interval = time.perf_counter() - self.start_time
-        self.is_force_stopped = forceStop
\ No newline at end of file
+        self.is_force_stopped = forceStop
+
+cyclist_snapshot = MemorySnapshot(cyclist_memory, LoopTimer)
+
+def cyclist_restore_memory():
+    """Brings back memory saved before restart"""
+    try:
+        for loop_id in cyclist_snapshot.restore():
+            cyclist_report.mark_dirty(loop_id)
+    except Exception as e:
+        logging.warning(f"Cyclist: memory snapshot can't be restored: {e}")
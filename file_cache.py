@@ -0,0 +1,231 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import folder_paths
+
+from .profiler import profiler
+
+FINGERPRINT_CHUNK_SIZE = 8 * 1024 * 1024 # Hashing is streamed in 8 MB chunks, never reading a whole checkpoint into RAM
+FINGERPRINT_INDEX_PERSIST = True # Keep known hashes in a sidecar file, so they survive restarts
+FINGERPRINT_INDEX_FILENAME = ".cyclist_fingerprints.json"
+DECODED_CACHE_MAX_BYTES = 1024 * 1024 * 1024 # Decoded images and latents kept in RAM between Override* and Reload* nodes
+CHECKPOINT_CACHE_BUDGET_BYTES = 8 * 1024 * 1024 * 1024 # Loaded (MODEL, CLIP, VAE) triples kept by Reload Model. 0 disables the cache
+
+def file_stat_key(path):
+    """Returns (inode, size, mtime_ns) of a file, or None if it doesn't exist. Any change of the file changes this key."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+class FingerprintCache:
+    """Remembers SHA-256 of files. A file is rehashed only if its inode, size or modification time changes."""
+
+    def __init__(self):
+        self.entries = {} # path -> [inode, size, mtime_ns, hexdigest]
+        self.lock = threading.Lock()
+        self.index_loaded = False
+
+    def index_path(self):
+        return os.path.join(folder_paths.get_output_directory(), FINGERPRINT_INDEX_FILENAME)
+
+    def load_index(self):
+        self.index_loaded = True
+        if not FINGERPRINT_INDEX_PERSIST:
+            return
+        try:
+            with open(self.index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+            for path, entry in index.items():
+                if isinstance(entry, list) and len(entry) == 4:
+                    self.entries[path] = entry
+        except FileNotFoundError:
+            pass
+        except:
+            logging.warning("Cyclist: fingerprint index is unreadable, files will be rehashed.")
+
+    def save_index(self):
+        if not FINGERPRINT_INDEX_PERSIST:
+            return
+        index_path = self.index_path()
+        try:
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, index_path)
+        except:
+            logging.warning("Cyclist: failed to save fingerprint index. Harmless, but files will be rehashed after restart.")
+
+    def get(self, path):
+        """Returns hex SHA-256 of a file content, or None if there is no such file"""
+        path = os.path.abspath(path)
+        key = file_stat_key(path)
+        if key is None:
+            return None
+        with self.lock:
+            if not self.index_loaded:
+                self.load_index()
+            entry = self.entries.get(path)
+            if entry is not None and tuple(entry[:3]) == key:
+                return entry[3]
+
+        digest = hash_file(path)
+        key_after = file_stat_key(path)
+        if key_after != key:
+            return digest # File was changed while hashing. Don't remember anything, next call will hash again
+
+        with self.lock:
+            self.entries[path] = [key[0], key[1], key[2], digest]
+            # Forget files that are gone, so the index doesn't grow with every "New Cycle"
+            for gone in [p for p in self.entries if p != path and not os.path.exists(p)]:
+                del self.entries[gone]
+            self.save_index()
+        return digest
+
+def hash_file(path):
+    m = hashlib.sha256()
+    with profiler.span("fingerprint.sha256", path=os.path.basename(path)), open(path, 'rb') as f:
+        while True:
+            chunk = f.read(FINGERPRINT_CHUNK_SIZE)
+            if not chunk:
+                break
+            m.update(chunk)
+    return m.digest().hex()
+
+fingerprint_cache = FingerprintCache()
+
+def file_fingerprint(path):
+    return fingerprint_cache.get(path)
+
+def value_bytes(value):
+    """Approximate size of tensors inside a value. Everything that is not a tensor is counted as free."""
+    if hasattr(value, "element_size") and hasattr(value, "numel"):
+        return value.numel() * value.element_size()
+    if isinstance(value, dict):
+        return sum(value_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_bytes(v) for v in value)
+    return 0
+
+class DecodedCache:
+    """Keeps tensors that were just written to (or read from) a file, so they don't have to be decoded again.
+    An entry is only valid while the file's stat is the same as it was when the entry was put."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # path -> (stat key, value, bytes), least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def put(self, path, value):
+        path = os.path.abspath(path)
+        key = file_stat_key(path)
+        size = value_bytes(value)
+        with self.lock:
+            self._discard(path)
+            if key is None or size > self.max_bytes:
+                return
+            self.entries[path] = (key, value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, old_size) = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] != file_stat_key(path):
+                self._discard(path) # File was changed by someone else
+                return None
+            self.entries.move_to_end(path)
+            return entry[1]
+
+    def discard(self, path):
+        with self.lock:
+            self._discard(os.path.abspath(path))
+
+    def _discard(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+decoded_cache = DecodedCache(DECODED_CACHE_MAX_BYTES)
+
+def checkpoint_bytes(checkpoint):
+    """Approximate size of loaded (MODEL, CLIP, VAE) weights"""
+    total = 0
+    for part in checkpoint:
+        if part is None:
+            continue
+        if hasattr(part, "model_size"): # ModelPatcher
+            total += part.model_size()
+            continue
+        module = getattr(part, "cond_stage_model", None) # CLIP
+        if module is None:
+            module = getattr(part, "first_stage_model", None) # VAE
+        if module is not None:
+            total += value_bytes(list(module.state_dict().values()))
+    return total
+
+class CheckpointCache:
+    """Keeps loaded checkpoints by file path and fingerprint, evicting least recently used ones when RAM budget is exceeded.
+    Once a file changes, its old checkpoint is dropped before the new one is loaded, so two of them are never held for one path."""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict() # path -> (fingerprint, (model, clip, vae), bytes), least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, fingerprint):
+        path = os.path.abspath(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] != fingerprint:
+                self._discard(path) # Stale: file was overwritten since
+                entry = None
+            if entry is None and fingerprint is not None:
+                # Same content may be cached for another path
+                entry = next((e for e in self.entries.values() if e[0] == fingerprint), None)
+            if entry is None or fingerprint is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if path in self.entries:
+                self.entries.move_to_end(path)
+            logging.info(f"Cyclist: checkpoint is taken from cache ({self.hits} hits, {self.misses} misses)")
+            return entry[1]
+
+    def put(self, path, fingerprint, checkpoint):
+        if fingerprint is None or self.budget_bytes <= 0:
+            return
+        path = os.path.abspath(path)
+        size = checkpoint_bytes(checkpoint)
+        with self.lock:
+            self._discard(path)
+            if size > self.budget_bytes:
+                logging.info(f"Cyclist: checkpoint is too big to be cached ({size / 2**30:.2f} GB)")
+                return
+            self.entries[path] = (fingerprint, checkpoint, size)
+            self.total_bytes += size
+            while self.total_bytes > self.budget_bytes:
+                evicted, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                logging.info(f"Cyclist: checkpoint {evicted} is evicted from cache ({evicted_size / 2**30:.2f} GB)")
+
+    def _discard(self, path):
+        old = self.entries.pop(path, None)
+        if old is not None:
+            self.total_bytes -= old[2]
+
+checkpoint_cache = CheckpointCache(CHECKPOINT_CACHE_BUDGET_BYTES)
@@ -0,0 +1,114 @@
+import math
+
+import numpy as np
+import torch
+import safetensors.torch
+from safetensors import safe_open
+from PIL import Image, ImageOps
+from PIL.PngImagePlugin import PngInfo
+
+# Format name -> file extension. Intermediate loop state that only Cyclist reads back doesn't need to be small
+IMAGE_FORMATS = {"png": ".png",
+                 "png_uncompressed": ".png",
+                 "webp_lossless": ".webp",
+                 "raw": ".image"}
+IMAGE_EXTENSIONS = (".png", ".webp", ".image")
+
+BATCH_METADATA_KEY = "cyclist_batch"
+
+def batch_grid(batch_size):
+    """(rows, columns) to put a batch into a single picture"""
+    columns = math.ceil(math.sqrt(batch_size))
+    return (math.ceil(batch_size / columns), columns)
+
+def encode_image(path, pixels, image_format="png", metadata=None):
+    """Saves uint8 pixels [B, H, W, C] into one file. Metadata is a dict of strings. WebP can't keep it.
+    PNG and WebP store a batch as a grid of images: their multi-frame encoders merge identical frames, losing batch items."""
+    if image_format == "raw":
+        safetensors.torch.save_file({"pixels": torch.from_numpy(np.ascontiguousarray(pixels))}, path, metadata=metadata)
+        return
+
+    batch_size, height, width, channels = pixels.shape
+    if batch_size == 1:
+        img = Image.fromarray(pixels[0])
+    else:
+        rows, columns = batch_grid(batch_size)
+        grid = np.zeros((rows * height, columns * width, channels), dtype=np.uint8)
+        for n in range(batch_size):
+            row, column = divmod(n, columns)
+            grid[row * height:(row + 1) * height, column * width:(column + 1) * width] = pixels[n]
+        img = Image.fromarray(grid)
+
+    if image_format == "webp_lossless":
+        exif = Image.Exif()
+        if batch_size > 1:
+            exif[0x010E] = f"{BATCH_METADATA_KEY}={batch_size}" # ImageDescription tag
+        img.save(path, format="WEBP", lossless=True, quality=0, method=0, exif=exif.tobytes()) # Fastest lossless settings
+        return
+
+    pnginfo = PngInfo()
+    if metadata is not None:
+        for key, value in metadata.items():
+            pnginfo.add_text(key, value)
+    if batch_size > 1:
+        pnginfo.add_text(BATCH_METADATA_KEY, str(batch_size))
+    compress_level = 0 if image_format == "png_uncompressed" else 4
+    img.save(path, format="PNG", pnginfo=pnginfo, compress_level=compress_level)
+
+def pixels_to_image(pixels, channels=4):
+    """uint8 pixels [B, H, W, C] -> float IMAGE batch [B, H, W, channels].
+    Only the result is allocated: conversion happens while copying, and normalization is done in place."""
+    if not torch.is_tensor(pixels):
+        pixels = torch.from_numpy(np.ascontiguousarray(pixels))
+    common = min(channels, pixels.size()[-1])
+    image = torch.empty((*pixels.size()[:-1], channels), dtype=torch.float32)
+    image[..., :common].copy_(pixels[..., :common])
+    if channels > common:
+        image[..., common:] = 255.0 # Opaque alpha
+    return image.div_(255.0)
+
+def image_batch_size(image):
+    if BATCH_METADATA_KEY in image.info:
+        return int(image.info[BATCH_METADATA_KEY])
+    description = image.getexif().get(0x010E, "")
+    if isinstance(description, str) and description.startswith(f"{BATCH_METADATA_KEY}="):
+        return int(description[len(BATCH_METADATA_KEY) + 1:])
+    return 1
+
+def decode_pixels(path):
+    """Loads a file of any of IMAGE_FORMATS as uint8 pixels [B, H, W, C]. C is 4 if the image has transparency, 3 otherwise."""
+    if path.endswith(IMAGE_FORMATS["raw"]):
+        with safe_open(path, framework="pt", device="cpu") as f:
+            pixels = f.get_tensor("pixels")
+        if pixels.dim() == 3:
+            pixels = pixels[None,]
+        return pixels
+
+    image = Image.open(path)
+    batch_size = image_batch_size(image)
+    if getattr(image, "is_animated", False):
+        image.seek(0) # Animations are not batches, only the first frame is loaded
+    i = ImageOps.exif_transpose(image) if batch_size == 1 else image
+    if i.mode == 'I':
+        i = i.point(lambda i: i * (1 / 255))
+    has_alpha = i.mode in ("RGBA", "LA", "PA") or (i.mode == "P" and "transparency" in i.info)
+    pixels = np.array(i.convert("RGBA" if has_alpha else "RGB"))
+    if batch_size > 1:
+        rows, columns = batch_grid(batch_size)
+        height, width = pixels.shape[0] // rows, pixels.shape[1] // columns
+        pixels = np.stack([pixels[(n // columns) * height:(n // columns + 1) * height, (n % columns) * width:(n % columns + 1) * width]
+                           for n in range(batch_size)])
+    else:
+        pixels = pixels[None,]
+    return torch.from_numpy(pixels)
+
+def load_latent(path):
+    """Loads samples from a .latent file. Opened with memory mapping, converted and scaled only if needed, and in place."""
+    with safe_open(path, framework="pt", device="cpu") as f:
+        is_scaled = "latent_format_version_0" in f.keys()
+        samples = f.get_tensor("latent_tensor")
+    if samples.dtype != torch.float32:
+        samples = samples.float()
+    if not is_scaled:
+        samples.mul_(1.0 / 0.18215)
+    return samples
@@ -0,0 +1,159 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+from server import PromptServer
+
+from .profiler import profiler
+
+WRITER_THREADS = 2
+WRITER_QUEUE_SIZE = 4 # Writes waiting for a thread. When it's full, Override* nodes wait instead of piling up tensors in RAM
+
+class WriteJob:
+    __slots__ = ("path", "encode", "on_done", "loop_id", "var_type", "preview", "previous", "superseded", "started", "done", "submit_time")
+
+    def __init__(self, path, encode, on_done, loop_id, var_type, preview, previous):
+        self.path = path
+        self.encode = encode
+        self.on_done = on_done
+        self.loop_id = loop_id
+        self.var_type = var_type
+        self.preview = preview
+        self.previous = previous
+        self.superseded = False
+        self.started = False
+        self.done = threading.Event()
+        self.submit_time = time.perf_counter()
+
+class BackgroundWriter:
+    """Encodes and saves files in background threads. Writes to the same path are kept in order, and a write that is
+    already outdated by a newer one is skipped. Every file is written to a temporary name, fsynced and then moved in place,
+    so readers never see a half-written file."""
+
+    def __init__(self, threads, queue_size):
+        self.thread_count = threads
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pending = {} # path -> last submitted job
+        self.failures = {} # (loop_id, var_type) -> error of its last write, until a write of it succeeds
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.thread_count):
+                thread = threading.Thread(target=self.work, name=f"cyclist-writer-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, path, encode, on_done=None, loop_id=None, var_type=None, preview=None):
+        """Queues encode(temporary_path). on_done(path) is called after the file is in place.
+        preview ({"node": id, "output": ui}) is sent to UI along with "cyclist.writer.done", when the file can be shown."""
+        self.start()
+        path = os.path.abspath(path)
+        with self.lock:
+            previous = self.pending.get(path)
+            if previous is not None and not previous.started:
+                previous.superseded = True # It would be overwritten anyway
+                previous = previous.previous
+            job = WriteJob(path, encode, on_done, loop_id, var_type, preview, previous)
+            self.pending[path] = job
+            self.failures.pop((loop_id, var_type), None) # New attempt, old failure doesn't matter anymore
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            wait_start = time.perf_counter()
+            self.queue.put(job)
+            logging.info(f"Cyclist: write queue is full, waited {(time.perf_counter() - wait_start) * 1000:.0f} ms")
+        return job
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                with self.lock:
+                    skip = job.superseded
+                    job.started = True
+                if not skip:
+                    if job.previous is not None:
+                        job.previous.done.wait()
+                    self.write(job)
+            finally:
+                job.previous = None
+                job.done.set()
+                with self.lock:
+                    if self.pending.get(job.path) is job:
+                        del self.pending[job.path]
+                self.queue.task_done()
+
+    def write(self, job):
+        root, extension = os.path.splitext(job.path)
+        tmp_path = f"{root}.writing{extension}"
+        encode_start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(job.path), exist_ok=True)
+            with profiler.span(f"{job.var_type or 'file'}.encode", job.loop_id, path=os.path.basename(job.path)):
+                job.encode(tmp_path)
+            with profiler.span(f"{job.var_type or 'file'}.fsync", job.loop_id):
+                with open(tmp_path, "r+b") as f:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, job.path)
+            if job.on_done is not None:
+                job.on_done(job.path)
+        except Exception as e:
+            logging.error(f"Cyclist: failed to write {job.path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            with self.lock:
+                self.failures[(job.loop_id, job.var_type)] = f"{os.path.basename(job.path)}: {e}"
+            try:
+                PromptServer.instance.send_sync("cyclist.writer.failed", {"loop_id": job.loop_id, "var_type": job.var_type,
+                                                                          "message": f"Cyclist failed to write {job.path}:\n{e}"})
+            except:
+                pass
+            return
+        with self.lock:
+            self.failures.pop((job.loop_id, job.var_type), None)
+
+        finish_time = time.perf_counter()
+        write_ms = (finish_time - encode_start) * 1000
+        total_ms = (finish_time - job.submit_time) * 1000
+        logging.debug(f"Cyclist: {job.path} is written in {write_ms:.0f} ms ({total_ms:.0f} ms after submit)")
+        if job.loop_id is not None:
+            try:
+                PromptServer.instance.send_sync("cyclist.writer.done", {"loop_id": job.loop_id, "var_type": job.var_type,
+                                                                        "write_ms": write_ms, "total_ms": total_ms,
+                                                                        "preview": job.preview})
+            except:
+                pass # No UI to report to. Shutting down, perhaps
+
+    def take_failure(self, loop_id, var_type):
+        """Error of the last write for this loop and type, or None if it succeeded. Every failure is given only once."""
+        with self.lock:
+            return self.failures.pop((loop_id, var_type), None)
+
+    def is_pending(self, path):
+        with self.lock:
+            return os.path.abspath(path) in self.pending
+
+    def flush(self, path):
+        """Waits until every queued write of this path is finished"""
+        with self.lock:
+            job = self.pending.get(os.path.abspath(path))
+        if job is not None:
+            job.done.wait()
+
+    def flush_all(self):
+        with self.lock:
+            jobs = list(self.pending.values())
+        for job in jobs:
+            job.done.wait()
+
+background_writer = BackgroundWriter(WRITER_THREADS, WRITER_QUEUE_SIZE)
+atexit.register(background_writer.flush_all)
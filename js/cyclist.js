@@ -5,6 +5,38 @@ import { ComfyButton } from "../../../scripts/ui/components/button.js";
 import { ComfyWidgets } from "../../../scripts/widgets.js";
 
 var cyclist_states = {}
+var cyclist_report = {revision: 0, sections: {}, extra: ""} // Memory report as seen by the UI, patched by updates from nodes
+
+async function applyMemoryUpdate(update) {
+    if (!update || update.revision === cyclist_report.revision) return
+    if (update.base === cyclist_report.revision) {
+        for (const [loop_id, text] of Object.entries(update.sections)) {
+            if (text === null) delete cyclist_report.sections[loop_id];
+            else cyclist_report.sections[loop_id] = text;
+        }
+        cyclist_report.revision = update.revision
+    } else {
+        // Some updates were missed (page was reloaded, for example). Get everything
+        const response = await api.fetchApi("/cyclist/memory_report")
+        if (response.status !== 200) return
+        const full = await response.json()
+        cyclist_report.sections = full.sections
+        cyclist_report.revision = full.revision
+    }
+    showMemoryReport()
+}
+
+function showMemoryReport() {
+    let memory_content = Object.values(cyclist_report.sections).reverse().join("\n\n")
+    if (memory_content === "") memory_content = "-- Memory empty --"
+    if (cyclist_report.extra !== "") memory_content += "\n\n" + cyclist_report.extra
+    for (var node_index in app.graph._nodes) {
+        if (app.graph._nodes[node_index].type === "LoopManager") {
+            let memory_widget = app.graph._nodes[node_index].widgets?.find((w) => w.name === 'memory_content')
+            if (memory_widget) memory_widget.value = memory_content
+        }
+    }
+}
 
 function drawBadge(ctx, text, color="green") {
     if (text) {
@@ -99,6 +131,22 @@ app.registerExtension({
         }
         api.addEventListener("cyclist.timer.update", updateTimerHandler);
 
+        function writerDoneHandler(event) {
+            cyclist_states[event.detail.loop_id + "." + event.detail.var_type + ".write_time"] = `${event.detail.write_ms.toFixed(0)}ms`
+            let preview = event.detail.preview
+            if (preview && preview.node !== null) {
+                // File is finally there, so the node can show it. Same as if ComfyUI reported the node as executed
+                api.dispatchEvent(new CustomEvent("executed", {detail: {node: preview.node, display_node: preview.node, output: preview.output}}))
+            }
+        }
+        api.addEventListener("cyclist.writer.done", writerDoneHandler);
+
+        function writerFailedHandler(event) {
+            cyclist_states[event.detail.loop_id + "." + event.detail.var_type + ".write_time"] = "failed"
+            app.ui.dialog.show(event.detail.message)
+        }
+        api.addEventListener("cyclist.writer.failed", writerFailedHandler);
+
         const btns = document.querySelector(".comfy-menu-btns")
         $el("button", {
             id: "cyclist-new-cycle-button",
@@ -116,6 +164,44 @@ app.registerExtension({
         if (typeof app.menu?.viewGroup !== 'undefined' && app.menu?.viewGroup !== null) {
             app.menu.viewGroup.append(newCycleButton)
         }
+
+        // Server cycle: server queues the prompt by itself until Interrupt, no Auto Queue and no open tab needed
+        const serverCycleButton = $el("button", {
+            id: "cyclist-server-cycle-button",
+            textContent: "Cycle on Server",
+            parent: btns,
+            onclick: toggleServerCycle
+        });
+        async function toggleServerCycle() {
+            if (cyclist_states["ServerDriver"]) {
+                await api.fetchApi("/cyclist/loop_driver/stop", {method: "POST", body: JSON.stringify({driver_id: cyclist_states["ServerDriver"]})})
+                return
+            }
+            let iterations = prompt("Iterations to run (0 - until Interrupt node stops it):", "0")
+            if (iterations === null) return
+            const p = await app.graphToPrompt()
+            const response = await api.fetchApi("/cyclist/loop_driver/start", {
+                method: "POST",
+                body: JSON.stringify({prompt: p.output, client_id: api.clientId, extra_data: {extra_pnginfo: {workflow: p.workflow}},
+                                      max_iterations: parseInt(iterations) || 0})
+            })
+            if (response.status !== 200) {
+                app.ui.dialog.show(`Cycle on Server failed to start: ${(await response.json()).error}`)
+                return
+            }
+            cyclist_states["ServerDriver"] = (await response.json()).driver_id
+            serverCycleButton.textContent = "Stop Server Cycle"
+        }
+        function driverUpdateHandler(event) {
+            if (event.detail.driver_id !== cyclist_states["ServerDriver"]) return
+            if (event.detail.running) {
+                serverCycleButton.textContent = `Stop Server Cycle (${event.detail.iteration})`
+            } else {
+                cyclist_states["ServerDriver"] = null
+                serverCycleButton.textContent = "Cycle on Server"
+            }
+        }
+        api.addEventListener("cyclist.driver.update", driverUpdateHandler);
         async function newCycle() {
             let already_incremented = []
             for (var node_index in app.graph._nodes) {
@@ -206,7 +292,9 @@ app.registerExtension({
 
                     memory_widget = this.widgets?.find((w) => w.name === 'memory_content')
                 }
-                if (memory_widget) memory_widget.value = message.memory_content[0];
+                cyclist_report.extra = message.memory_extra[0]
+                applyMemoryUpdate(message.memory_update[0])
+                showMemoryReport()
 				this.onResize?.(this.size);
 
                 cyclist_states["LoopManagerNode" + String(this.id)] = message.increment[0]
@@ -220,6 +308,7 @@ app.registerExtension({
             const onExecuted = nodeType.prototype.onExecuted;
             nodeType.prototype.onExecuted = function (message) {
 				onExecuted?.apply(this, arguments)
+                if (!message.counter) return // Preview of a file written in background
                 let state = "Iteration: " + String(message.counter[0])
                 //let state_id_node = String(this.id)
                 //cyclist_states[state_id_node] = state
@@ -231,12 +320,7 @@ app.registerExtension({
                     cyclist_states[state_id_loop] = state
                 }
 
-                for (var node_index in app.graph._nodes) {
-                    if (app.graph._nodes[node_index].type === "LoopManager") {
-                        let memory_widget = app.graph._nodes[node_index].widgets?.find((w) => w.name === 'memory_content')
-                        if (memory_widget) memory_widget.value = message.memory_content[0]
-                    }
-                }
+                applyMemoryUpdate(message.memory_update[0])
 			};
             const onDrawForeground = nodeType.prototype.onDrawForeground;
 		    nodeType.prototype.onDrawForeground = function (ctx) {
@@ -245,7 +329,12 @@ app.registerExtension({
                 let loop_id = getLoopID(this)
                 let to_memory_input = this.inputs?.find((i) => i.name === "to_memory")
                 if (!to_memory_input && this.inputs && this.inputs.length > 0) to_memory_input = this.inputs[0];
-                if (loop_id && to_memory_input) drawBadge(ctx, cyclist_states[loop_id + "." + to_memory_input.type])
+                if (loop_id && to_memory_input) {
+                    let state = cyclist_states[loop_id + "." + to_memory_input.type]
+                    let write_time = cyclist_states[loop_id + "." + to_memory_input.type + ".write_time"]
+                    if (state && write_time) state += " | " + write_time
+                    drawBadge(ctx, state)
+                }
                 //if (!state) state = cyclist_states[String(this.id)]
 
                 return r
@@ -281,6 +370,21 @@ app.registerExtension({
                 return r
             }
         }
+        if (nodeData.name === "CyclistProfiler") {
+            const onExecuted = nodeType.prototype.onExecuted
+            nodeType.prototype.onExecuted = function (message) {
+				onExecuted?.apply(this, arguments)
+
+                let summary_widget = this.widgets?.find((w) => w.name === 'summary_text')
+                if (!summary_widget) {
+                    summary_widget = ComfyWidgets["STRING"](this, "summary_text", ["STRING", { multiline: true }], app).widget
+                    summary_widget.inputEl.readOnly = true
+                    summary_widget.inputEl.style.opacity = 0.6
+                }
+                summary_widget.value = message.text[0]
+				this.onResize?.(this.size);
+			};
+        }
         if (nodeData.name === "CyclistTimerStop") {
             nodeType.prototype.IS_CYCLIST_IO = true
         }
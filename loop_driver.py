@@ -0,0 +1,165 @@
+import time
+import uuid
+import asyncio
+import logging
+
+import aiohttp
+from server import PromptServer
+from comfy.cli_args import args
+
+from .timer_stats import IterationStats
+from .util_nodes import CyclistCompare
+
+DRIVER_POLL_SECONDS = 0.02 # How often a driver checks if its prompt is done
+DRIVER_FINISHED_KEPT = 20 # Finished drivers still shown by status request
+
+def prompt_url():
+    """Address of this server's own /prompt endpoint"""
+    server = PromptServer.instance
+    address = getattr(server, "address", "127.0.0.1")
+    port = getattr(server, "port", 8188)
+    if address in ("", "0.0.0.0"):
+        address = "127.0.0.1"
+    elif address == "::":
+        address = "::1"
+    if ":" in address:
+        address = f"[{address}]"
+    scheme = "https" if getattr(args, "tls_keyfile", None) else "http"
+    return f"{scheme}://{address}:{port}/prompt"
+
+class LoopDriver:
+    """Queues the same prompt again every time it's done, until a limit, a condition or Interrupt node stops it"""
+
+    def __init__(self, drivers, prompt, extra_data=None, client_id=None, max_iterations=0, time_budget=0.0, stop_when=None):
+        self.drivers = drivers
+        self.id = uuid.uuid4().hex[:8]
+        self.prompt = prompt
+        self.extra_data = extra_data or {}
+        self.client_id = client_id
+        self.max_iterations = max_iterations # 0 is no limit
+        self.time_budget = time_budget # Seconds, 0 is no limit
+        self.stop_when = stop_when # {"loop_id", "var_type", "condition", "value"}: compared with Compare Anything rules
+        self.iteration = 0
+        self.stats = IterationStats()
+        self.started = time.perf_counter()
+        self.stopping = False
+        self.reason = None # Why it stopped, None while running
+        self.task = None
+
+    def status(self):
+        return {"driver_id": self.id, "iteration": self.iteration, "max_iterations": self.max_iterations,
+                "elapsed": time.perf_counter() - self.started, "time_budget": self.time_budget,
+                "mean": self.stats.mean, "running": self.reason is None, "reason": self.reason}
+
+    def condition_met(self):
+        if not self.stop_when:
+            return False
+        loop_id = self.stop_when.get("loop_id")
+        var_type = self.stop_when.get("var_type", "INT")
+        memory = self.drivers.memory
+        if not memory.has(loop_id, var_type):
+            return False
+        result, _, _ = CyclistCompare().compare(self.stop_when.get("condition", "equals"), memory.get(loop_id, var_type), self.stop_when.get("value"))
+        return result
+
+    def stop_reason(self):
+        if self.stopping:
+            return "stopped"
+        if self.max_iterations > 0 and self.iteration >= self.max_iterations:
+            return "max iterations"
+        if self.time_budget > 0:
+            next_time = self.stats.predict_next() if self.stats.count > 0 else 0.0
+            if time.perf_counter() - self.started + next_time > self.time_budget:
+                return "time budget"
+        if self.condition_met():
+            return "condition met"
+        return None
+
+    async def queue_prompt(self, session):
+        body = {"prompt": self.prompt, "client_id": self.client_id, "extra_data": self.extra_data}
+        async with session.post(prompt_url(), json=body, ssl=False) as response:
+            result = await response.json()
+            if response.status != 200:
+                raise Exception(f"Prompt was not accepted: {result.get('error', result)}")
+            return result["prompt_id"]
+
+    async def wait(self, prompt_id):
+        """Waits for the prompt to leave the queue. Returns "success", "error", "interrupted" or "removed"."""
+        queue = PromptServer.instance.prompt_queue
+        current_queue = getattr(queue, "get_current_queue_volatile", queue.get_current_queue) # Newer ComfyUI doesn't copy
+        while True:
+            running, pending = current_queue()
+            queued = any(item[1] == prompt_id for item in list(running) + list(pending))
+            history = queue.get_history(prompt_id=prompt_id) # Checked after the queue, so a prompt can't slip between them
+            if prompt_id in history:
+                status = history[prompt_id].get("status") or {}
+                if any(message[0] == "execution_interrupted" for message in status.get("messages", [])):
+                    return "interrupted"
+                return status.get("status_str", "success")
+            if not queued:
+                return "removed"
+            await asyncio.sleep(DRIVER_POLL_SECONDS)
+
+    async def run(self):
+        try:
+            async with aiohttp.ClientSession() as session:
+                while True:
+                    self.reason = self.stop_reason()
+                    if self.reason is not None:
+                        break
+                    interrupts = self.drivers.interrupts
+                    iteration_start = time.perf_counter()
+                    result = await self.wait(await self.queue_prompt(session))
+                    self.stats.add(time.perf_counter() - iteration_start)
+                    self.iteration += 1
+                    if self.drivers.interrupts != interrupts:
+                        self.reason = "interrupted"
+                        break
+                    if result != "success":
+                        self.reason = f"prompt {result}"
+                        break
+                    self.drivers.send_update(self)
+        except asyncio.CancelledError:
+            self.reason = "stopped"
+        except Exception as e:
+            logging.warning(f"Cyclist: loop driver {self.id} failed: {e}")
+            self.reason = f"error: {e}"
+        if self.reason is None:
+            self.reason = "stopped"
+        logging.info(f"Cyclist: loop driver {self.id} is done after {self.iteration} iterations ({self.reason})")
+        self.drivers.send_update(self)
+
+class LoopDrivers:
+    """Loop drivers started on this server. Interrupt node stops all of them."""
+
+    def __init__(self, memory):
+        self.memory = memory # To check stop conditions
+        self.drivers = {} # driver id -> LoopDriver, running and last finished ones
+        self.interrupts = 0 # Incremented by Interrupt node, drivers compare it before and after their iteration
+
+    def start(self, prompt, **options):
+        driver = LoopDriver(self, prompt, **options)
+        self.drivers[driver.id] = driver
+        finished = [d for d in self.drivers.values() if d.reason is not None]
+        for old in finished[:max(0, len(finished) - DRIVER_FINISHED_KEPT)]:
+            del self.drivers[old.id]
+        driver.task = asyncio.create_task(driver.run()) # Called from a route, so the server's loop is running
+        return driver
+
+    def stop(self, driver_id=None):
+        """Stops one driver, or all of them. Prompt that is already queued still runs."""
+        stopped = []
+        for driver in list(self.drivers.values()):
+            if driver.reason is None and (driver_id is None or driver.id == driver_id):
+                driver.stopping = True
+                stopped.append(driver.id)
+        return stopped
+
+    def interrupt(self):
+        self.interrupts += 1
+
+    def status(self):
+        return [driver.status() for driver in self.drivers.values()]
+
+    def send_update(self, driver):
+        PromptServer.instance.send_sync("cyclist.driver.update", driver.status())
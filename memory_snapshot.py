@@ -0,0 +1,225 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import torch
+import safetensors.torch
+from safetensors import safe_open
+
+import folder_paths
+
+from .file_writer import background_writer
+from .tensor_offload import OffloadedTensor
+from .value_history import ValueHistory
+
+SNAPSHOT_ENABLED = True # Memorized values survive restarts
+SNAPSHOT_FOLDER = ".cyclist_memory" # In the output folder
+SNAPSHOT_JOURNAL_FILENAME = "journal.jsonl"
+SNAPSHOT_VALUELESS_TYPES = ("IMAGE", "LATENT") # Memorize Image/Latent exist to avoid per-iteration file writes, so only counters are saved
+SNAPSHOT_COMPACT_LINES = 10000 # Journal is rewritten with only the latest lines when it grows longer than that
+
+def pack_value(value, tensors):
+    """JSON skeleton of a value. Tensors are replaced with references and collected into tensors dict (not copied).
+    Raises TypeError for anything that can't be restored from JSON and tensors: models, ControlNets, etc."""
+    if isinstance(value, OffloadedTensor):
+        key = f"t{len(tensors)}"
+        tensors[key] = value.tensor
+        return {"__offloaded__": key, "device": str(value.device), "dtype": str(value.dtype).replace("torch.", "")}
+    if isinstance(value, ValueHistory):
+        return {"__history__": value.to_list(), "capacity": value.capacity, "typecode": value.typecode}
+    if torch.is_tensor(value):
+        key = f"t{len(tensors)}"
+        tensors[key] = value
+        return {"__tensor__": key}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return {"__list__" if isinstance(value, list) else "__tuple__": [pack_value(v, tensors) for v in value]}
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise TypeError("dict with non-string keys")
+        return {"__dict__": {key: pack_value(v, tensors) for key, v in value.items()}}
+    raise TypeError(f"{type(value).__name__} can't be saved")
+
+def unpack_value(skeleton, tensors):
+    if isinstance(skeleton, dict):
+        if "__tensor__" in skeleton:
+            return tensors[skeleton["__tensor__"]]
+        if "__offloaded__" in skeleton:
+            return OffloadedTensor(tensors[skeleton["__offloaded__"]], torch.device(skeleton["device"]), getattr(torch, skeleton["dtype"]))
+        if "__history__" in skeleton:
+            history = ValueHistory(skeleton["capacity"], skeleton["typecode"])
+            for value in skeleton["__history__"]:
+                history.push(value)
+            return history
+        if "__list__" in skeleton:
+            return [unpack_value(v, tensors) for v in skeleton["__list__"]]
+        if "__tuple__" in skeleton:
+            return tuple(unpack_value(v, tensors) for v in skeleton["__tuple__"])
+        return {key: unpack_value(v, tensors) for key, v in skeleton["__dict__"].items()}
+    return skeleton
+
+class MemorySnapshot:
+    """Keeps a copy of memory on disk as a journal: one JSON line per change of a (loop_id, var type) entry.
+    Scalars and strings are written into the line itself. Tensors go to a safetensors file per entry,
+    written by the background writer; the line is added only after the file is in place.
+    Journal is replayed on restore, and then compacted to the latest line of every entry."""
+
+    def __init__(self, memory, timer_factory):
+        self.memory = memory
+        self.timer_factory = timer_factory
+        self.latest = {} # (loop_id, var_type) -> latest journal line
+        self.timers = {} # loop_id -> total time of the loop timer
+        self.journal_lines = 0
+        self.lock = threading.RLock()
+
+    def folder(self):
+        return os.path.join(folder_paths.get_output_directory(), SNAPSHOT_FOLDER)
+
+    def journal_path(self):
+        return os.path.join(self.folder(), SNAPSHOT_JOURNAL_FILENAME)
+
+    def blob_name(self, loop_id, var_type, counter):
+        """Every write gets its own file, so the journal never refers to a file that was already overwritten"""
+        return hashlib.sha1(f"{loop_id}\n{var_type}".encode()).hexdigest() + f"_{counter}.safetensors"
+
+    def append(self, line):
+        previous = None
+        with self.lock:
+            if line["op"] == "put":
+                previous = self.latest.get((line["loop_id"], line["var_type"]))
+                self.latest[(line["loop_id"], line["var_type"])] = line
+            elif line["op"] == "timer":
+                self.timers[line["loop_id"]] = line["total"]
+            os.makedirs(self.folder(), exist_ok=True)
+            with open(self.journal_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(line) + "\n")
+            self.journal_lines += 1
+            if self.journal_lines > SNAPSHOT_COMPACT_LINES:
+                self.compact()
+        if previous is not None and previous.get("blob") not in (None, line.get("blob")):
+            try:
+                os.remove(os.path.join(self.folder(), previous["blob"]))
+            except OSError:
+                pass
+
+    def compact(self):
+        """Rewrites the journal with only the lines that are still needed"""
+        with self.lock:
+            path = self.journal_path()
+            tmp_path = path + ".tmp"
+            os.makedirs(self.folder(), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for line in self.latest.values():
+                    f.write(json.dumps(line) + "\n")
+                for loop_id, total in self.timers.items():
+                    f.write(json.dumps({"op": "timer", "loop_id": loop_id, "total": total}) + "\n")
+            os.replace(tmp_path, path)
+            self.journal_lines = len(self.latest) + len(self.timers)
+
+    def record(self, loop_id, var_type):
+        """Saves the current state of an entry. Doesn't wait for tensors to be written."""
+        if not SNAPSHOT_ENABLED:
+            return
+        entry = self.memory.entry(loop_id, var_type)
+        if entry is None:
+            return
+        timer = self.memory.timer(loop_id, self.timer_factory)
+        line = {"op": "put", "loop_id": loop_id, "var_type": str(var_type), "counter": entry.counter}
+        tensors = {}
+        if entry.has_value and str(var_type) not in SNAPSHOT_VALUELESS_TYPES:
+            try:
+                line["value"] = pack_value(entry.value, tensors)
+            except TypeError as e:
+                logging.debug(f"Cyclist: {var_type} of loop {loop_id} is not saved to snapshot, only its counter: {e}")
+                tensors = {}
+        try:
+            if tensors:
+                line["blob"] = self.blob_name(loop_id, var_type, entry.counter)
+                def encode(tmp_path):
+                    copies = {key: t.detach().to("cpu", copy=True).contiguous() for key, t in tensors.items()}
+                    safetensors.torch.save_file(copies, tmp_path)
+                background_writer.submit(os.path.join(self.folder(), line["blob"]), encode, on_done=lambda path: self.append(line))
+            else:
+                self.append(line)
+            self.append({"op": "timer", "loop_id": loop_id, "total": timer.total_intervals})
+        except Exception as e:
+            logging.warning(f"Cyclist: failed to save memory snapshot: {e}")
+
+    def forget(self, loop_id):
+        """Removes a loop from the snapshot"""
+        if not SNAPSHOT_ENABLED:
+            return
+        with self.lock:
+            keys = [key for key in self.latest if key[0] == loop_id]
+            blobs = [self.latest.pop(key).get("blob") for key in keys]
+            self.timers.pop(loop_id, None)
+        try:
+            self.append({"op": "remove", "loop_id": loop_id})
+            for blob in blobs:
+                if blob is not None:
+                    path = os.path.join(self.folder(), blob)
+                    background_writer.flush(path)
+                    os.remove(path)
+        except OSError:
+            pass
+
+    def restore(self):
+        """Loads every entry from the journal into memory. Returns ids of restored loops."""
+        if not SNAPSHOT_ENABLED or not os.path.isfile(self.journal_path()):
+            return []
+        latest = {}
+        timers = {}
+        with open(self.journal_path(), "r", encoding="utf-8") as f:
+            for text in f:
+                try:
+                    line = json.loads(text)
+                except ValueError:
+                    continue # Line that was being written when the process died
+                if line["op"] == "put":
+                    latest[(line["loop_id"], line["var_type"])] = line
+                elif line["op"] == "timer":
+                    timers[line["loop_id"]] = line["total"]
+                elif line["op"] == "remove":
+                    latest = {key: l for key, l in latest.items() if key[0] != line["loop_id"]}
+                    timers.pop(line["loop_id"], None)
+
+        restored = []
+        for (loop_id, var_type), line in list(latest.items()):
+            try:
+                tensors = {}
+                if "blob" in line:
+                    with safe_open(os.path.join(self.folder(), line["blob"]), framework="pt", device="cpu") as f:
+                        tensors = {key: f.get_tensor(key) for key in f.keys()}
+                if "value" in line:
+                    value = unpack_value(line["value"], tensors)
+                    self.memory.restore(loop_id, var_type, line["counter"], value, True)
+                else:
+                    self.memory.restore(loop_id, var_type, line["counter"])
+            except Exception as e:
+                logging.warning(f"Cyclist: {var_type} of loop {loop_id} can't be restored: {e}")
+                del latest[(loop_id, var_type)]
+                continue
+            if not loop_id in restored:
+                restored.append(loop_id)
+        for loop_id, total in timers.items():
+            if loop_id in self.memory:
+                self.memory.timer(loop_id, self.timer_factory).total_intervals = total
+
+        latest = {key: line for key, line in latest.items() if key[0] in self.memory} # Restore itself can evict loops over the limits
+        with self.lock:
+            self.latest = latest
+            self.timers = {loop_id: total for loop_id, total in timers.items() if loop_id in self.memory}
+            self.compact()
+        # Blobs nobody refers to anymore
+        referenced = set(line.get("blob") for line in latest.values())
+        for name in os.listdir(self.folder()):
+            if name.endswith(".safetensors") and name not in referenced and not background_writer.is_pending(os.path.join(self.folder(), name)):
+                try:
+                    os.remove(os.path.join(self.folder(), name))
+                except OSError:
+                    pass
+        logging.info(f"Cyclist: {len(restored)} loops are restored from memory snapshot")
+        return restored
@@ -0,0 +1,238 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from .file_cache import value_bytes
+
+# Limits for stored loops. Loops marked active by a Loop Manager are never evicted. 0 disables a limit
+MEMORY_BUDGET_BYTES = 4 * 1024 * 1024 * 1024 # Tensors of all stored values
+MEMORY_LOOP_TTL_SECONDS = 24 * 3600 # Loops that were not touched for that long are forgotten
+MEMORY_MAX_LOOPS = 1000 # Least recently used loops are forgotten above that
+
+class MemoryEntry:
+    """Value of one type stored for one loop, with its write counter and timestamps (time.time())"""
+    __slots__ = ("value", "has_value", "size", "counter", "created", "updated", "accessed")
+
+    def __init__(self):
+        now = time.time()
+        self.value = None
+        self.has_value = False # None can be a value too
+        self.size = 0 # Bytes of tensors in value
+        self.counter = 0
+        self.created = now
+        self.updated = now
+        self.accessed = now
+
+class LoopMemory:
+    """Everything stored for one loop_id"""
+    __slots__ = ("entries", "timer", "size", "created", "accessed")
+
+    def __init__(self):
+        now = time.time()
+        self.entries = {} # var type -> MemoryEntry
+        self.size = 0
+        self.timer = None
+        self.created = now
+        self.accessed = now
+
+class MemoryLock:
+    """Reentrant lock that runs callbacks queued while it was held once the outermost holder releases it,
+    so they can take other locks without lock-order inversion"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0 # Only changed by the thread that holds the lock
+        self.pending = []
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        pending = []
+        if self.depth == 0:
+            pending, self.pending = self.pending, []
+        self.lock.release()
+        for callback in pending:
+            callback()
+        return False
+
+    def call_after(self, callback):
+        """Queues a callback till the lock is fully released. Must be called by the holder."""
+        self.pending.append(callback)
+
+class CyclistMemory:
+    """Values shared between Memorize*/Recall*, Override*/Reload* and timer nodes, by loop_id and var type.
+    Every method takes the lock, so executor and IS_CHANGED calls from other threads see consistent state.
+    Holding the lock across several calls is possible too: `with cyclist_memory.lock:`
+    Loops are evicted by budget, TTL and count, least recently used first. on_evict(loop_id) is called
+    after that, once the lock is released by the outermost `with`."""
+
+    def __init__(self, budget_bytes=MEMORY_BUDGET_BYTES, ttl_seconds=MEMORY_LOOP_TTL_SECONDS, max_loops=MEMORY_MAX_LOOPS):
+        self.loops = OrderedDict() # loop_id -> LoopMemory, least recently used first
+        self.total_bytes = 0
+        self.budget_bytes = budget_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_loops = max_loops
+        self.active = {} # owner (Loop Manager node id) -> loop_id it works with
+        self.on_evict = None
+        self.over_budget = False # Warning about it is shown once
+        self.lock = MemoryLock()
+
+    def __contains__(self, loop_id):
+        with self.lock:
+            return loop_id in self.loops
+
+    def loop_ids(self):
+        with self.lock:
+            return list(self.loops)
+
+    def var_types(self, loop_id):
+        with self.lock:
+            loop = self.loops.get(loop_id)
+            return list(loop.entries) if loop is not None else []
+
+    def _loop(self, loop_id, create):
+        loop = self.loops.get(loop_id)
+        if loop is None and create:
+            loop = LoopMemory()
+            self.loops[loop_id] = loop
+        return loop
+
+    def _touch(self, loop_id):
+        loop = self.loops[loop_id]
+        loop.accessed = time.time()
+        self.loops.move_to_end(loop_id)
+        return loop.accessed
+
+    def _entry(self, loop_id, var_type, create):
+        loop = self._loop(loop_id, create)
+        if loop is None:
+            return None
+        entry = loop.entries.get(var_type)
+        if entry is None and create:
+            entry = MemoryEntry()
+            loop.entries[var_type] = entry
+        return entry
+
+    def entry(self, loop_id, var_type):
+        """MemoryEntry, or None if nothing of this type was ever stored or counted for the loop. Read-only use, please."""
+        with self.lock:
+            return self._entry(loop_id, var_type, False)
+
+    def has(self, loop_id, var_type):
+        with self.lock:
+            entry = self._entry(loop_id, var_type, False)
+            return entry is not None and entry.has_value
+
+    def get(self, loop_id, var_type, default=None):
+        """Stored value, or default if there is none"""
+        with self.lock:
+            entry = self._entry(loop_id, var_type, False)
+            if entry is None or not entry.has_value:
+                return default
+            entry.accessed = self._touch(loop_id)
+            return entry.value
+
+    def put(self, loop_id, var_type, value, size=None):
+        """Stores a value. Its size is counted as size of tensors inside, unless given.
+        Other loops may be evicted to fit it, but never this one."""
+        if size is None:
+            size = value_bytes(value)
+        with self.lock:
+            entry = self._entry(loop_id, var_type, True)
+            loop = self.loops[loop_id]
+            loop.size += size - entry.size
+            self.total_bytes += size - entry.size
+            entry.value = value
+            entry.has_value = True
+            entry.size = size
+            entry.updated = entry.accessed = self._touch(loop_id)
+            self.evict(keep=loop_id)
+
+    def increment(self, loop_id, var_type):
+        """Counts one more write of this type for the loop. Returns the new counter."""
+        with self.lock:
+            entry = self._entry(loop_id, var_type, True)
+            entry.counter += 1
+            entry.updated = self._touch(loop_id)
+            return entry.counter
+
+    def loop_size(self, loop_id):
+        """Bytes of tensors stored for the loop"""
+        with self.lock:
+            loop = self.loops.get(loop_id)
+            return loop.size if loop is not None else 0
+
+    def counter(self, loop_id, var_type):
+        """Write counter, or None if there were no writes of this type for the loop"""
+        with self.lock:
+            entry = self._entry(loop_id, var_type, False)
+            return entry.counter if entry is not None else None
+
+    def restore(self, loop_id, var_type, counter, value=None, has_value=False):
+        """Puts an entry back as it was, with its counter"""
+        with self.lock:
+            entry = self._entry(loop_id, var_type, True)
+            entry.counter = counter
+            if has_value:
+                self.put(loop_id, var_type, value)
+
+    def timer(self, loop_id, factory):
+        """LoopTimer of the loop. It's created with factory() if the loop doesn't have one yet."""
+        with self.lock:
+            loop = self._loop(loop_id, True)
+            self._touch(loop_id)
+            if loop.timer is None:
+                loop.timer = factory()
+            return loop.timer
+
+    def remove(self, loop_id):
+        with self.lock:
+            loop = self.loops.pop(loop_id, None)
+            if loop is not None:
+                self.total_bytes -= loop.size
+            return loop
+
+    def set_active(self, owner, loop_id):
+        """Protects the loop from eviction while the owner works with it. Loop the owner used before is not protected anymore."""
+        with self.lock:
+            self.active[owner] = loop_id
+
+    def evict(self, keep=None):
+        """Forgets least recently used loops that are over any limit, except active ones and keep. Returns their ids."""
+        evicted = []
+        with self.lock:
+            protected = set(self.active.values())
+            protected.add(keep)
+            now = time.time()
+            loop_count = len(self.loops)
+            total_bytes = self.total_bytes
+            for loop_id, loop in self.loops.items():
+                over_budget = self.budget_bytes > 0 and total_bytes > self.budget_bytes
+                over_count = self.max_loops > 0 and loop_count > self.max_loops
+                expired = self.ttl_seconds > 0 and now - loop.accessed > self.ttl_seconds
+                if not (over_budget or over_count or expired):
+                    break # Every next loop was used more recently
+                if loop_id in protected:
+                    continue
+                loop_count -= 1
+                total_bytes -= loop.size
+                evicted.append(loop_id)
+                reason = "memory budget" if over_budget else ("loop limit" if over_count else "idle for too long")
+                logging.info(f"Cyclist: loop {loop_id} is evicted from memory ({reason}, {loop.size / 2**20:.1f} MB freed)")
+            for loop_id in evicted:
+                self.remove(loop_id)
+            if self.budget_bytes > 0 and self.total_bytes > self.budget_bytes:
+                if not self.over_budget:
+                    logging.warning(f"Cyclist: memory budget is exceeded by active loops ({self.total_bytes / 2**30:.2f} GB stored)")
+                self.over_budget = True
+            else:
+                self.over_budget = False
+            if self.on_evict is not None:
+                for loop_id in evicted:
+                    self.lock.call_after(lambda loop_id=loop_id: self.on_evict(loop_id))
+        return evicted
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+
+import torch
+import safetensors.torch
+from safetensors import safe_open
+
+DELTA_FORMAT = "cyclist-delta-1"
+DELTA_MANIFEST_EXTENSION = ".cyclist.json"
+DELTA_BLOB_FOLDER = ".cyclist_blobs"
+DELTA_BLOB_EXTENSION = ".tensor" # Not ".safetensors", so blobs don't show up in checkpoint lists
+DELTA_BLOB_GRACE_SECONDS = 600 # Unreferenced blobs younger than that are kept: some other save may be about to reference them
+
+def tensor_digest(tensor):
+    """Content address of a tensor: its dtype, shape and raw bytes"""
+    m = hashlib.blake2b(digest_size=20)
+    m.update(f"{tensor.dtype}|{tuple(tensor.shape)}|".encode())
+    if tensor.numel() > 0:
+        m.update(tensor.reshape(-1).view(torch.uint8).numpy())
+    return m.hexdigest()
+
+def blob_path(blob_root, digest):
+    return os.path.join(blob_root, digest[:2], f"{digest}{DELTA_BLOB_EXTENSION}")
+
+def manifest_blob_root(manifest_path):
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), DELTA_BLOB_FOLDER)
+
+def save_delta_checkpoint(manifest_path, state_dict, metadata=None):
+    """Saves every tensor, that is not stored yet, as a separate blob named by its content, and a manifest listing them.
+    Blobs are shared by all manifests in the same folder. Returns amount of bytes actually written to blobs."""
+    blob_root = manifest_blob_root(manifest_path)
+    tensors = {}
+    written = 0
+    for key, tensor in state_dict.items():
+        tensor = tensor.detach().to("cpu").contiguous()
+        digest = tensor_digest(tensor)
+        tensors[key] = digest
+        path = blob_path(blob_root, digest)
+        if os.path.isfile(path):
+            os.utime(path) # Keeps it away from garbage collection for a while
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.writing" # Another writer thread may save the same blob right now
+        try:
+            safetensors.torch.save_file({"tensor": tensor}, tmp_path)
+            with open(tmp_path, "r+b") as f:
+                os.fsync(f.fileno()) # Manifest is fsynced after blobs, so it never points at a half-written one
+            os.replace(tmp_path, path)
+        except OSError:
+            if not os.path.isfile(path):
+                raise
+            # Same content was placed by someone else meanwhile
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        written += tensor.numel() * tensor.element_size()
+
+    manifest = {"format": DELTA_FORMAT, "metadata": metadata if metadata is not None else {}, "tensors": tensors}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return written
+
+def load_delta_checkpoint(manifest_path):
+    """Returns (state_dict, metadata) reassembled from a manifest and its blobs"""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != DELTA_FORMAT:
+        raise Exception(f"Unknown delta checkpoint format: {manifest.get('format')}")
+
+    blob_root = manifest_blob_root(manifest_path)
+    loaded = {} # Same content can be used by several keys
+    state_dict = {}
+    for key, digest in manifest["tensors"].items():
+        if digest not in loaded:
+            with safe_open(blob_path(blob_root, digest), framework="pt", device="cpu") as f:
+                loaded[digest] = f.get_tensor("tensor")
+        state_dict[key] = loaded[digest]
+    return state_dict, manifest["metadata"]
+
+def collect_garbage(folder):
+    """Removes blobs no manifest in this folder refers to"""
+    blob_root = os.path.join(folder, DELTA_BLOB_FOLDER)
+    if not os.path.isdir(blob_root):
+        return
+    referenced = set()
+    for name in os.listdir(folder):
+        if not name.endswith(DELTA_MANIFEST_EXTENSION):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                referenced.update(json.load(f)["tensors"].values())
+        except:
+            logging.warning(f"Cyclist: can't read {path}. Garbage collection of blobs is skipped.")
+            return
+
+    now = time.time()
+    removed = 0
+    for root, dirs, files in os.walk(blob_root):
+        for name in files:
+            digest = name[:-len(DELTA_BLOB_EXTENSION)] if name.endswith(DELTA_BLOB_EXTENSION) else None
+            if digest in referenced:
+                continue
+            path = os.path.join(root, name)
+            try:
+                if now - os.path.getmtime(path) > DELTA_BLOB_GRACE_SECONDS:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    if removed > 0:
+        logging.info(f"Cyclist: removed {removed} unused blobs from {blob_root}")
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+import folder_paths
+
+PROFILER_FOLDER = ".cyclist_profile" # In the output folder, one Chrome trace (chrome://tracing, Perfetto) per iteration
+PROFILER_SUMMARY_WINDOW = 200 # Last durations kept for p50/p95 of every span name
+PROFILER_MAX_EVENTS = 100000 # Spans kept for one trace. More are only counted in the summary (Profiler node may be gone while enabled)
+PROFILER_MAX_TRACES = 100 # Older trace files are deleted
+
+class Span:
+    __slots__ = ("profiler", "name", "loop_id", "args", "start")
+
+    def __init__(self, profiler, name, loop_id, args):
+        self.profiler = profiler
+        self.name = name
+        self.loop_id = loop_id
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.loop_id, self.start, time.perf_counter(), self.args)
+        return False
+
+class NoSpan:
+    """What profiler gives when it's off. Costs one call and nothing else."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+class Profiler:
+    """Records spans of Cyclist work (reads, writes, encoding, decoding, hashing) while enabled. Spans of one iteration
+    are saved as a Chrome trace when the next iteration starts, and durations are kept for a rolling summary."""
+
+    def __init__(self):
+        self.enabled = False
+        self.iteration = 0
+        self.loop_id = None
+        self.events = []
+        self.dropped = 0 # Spans over PROFILER_MAX_EVENTS in this iteration
+        self.durations = {} # span name -> deque of last durations, in ms
+        self.lock = threading.Lock()
+
+    def span(self, name, loop_id=None, **args):
+        """Context manager measuring its block. Use as `with profiler.span("ReloadImage.decode", loop_id):`"""
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, loop_id, args)
+
+    def add(self, name, loop_id, start, end, args):
+        duration_ms = (end - start) * 1000
+        event = {"name": name, "cat": "cyclist", "ph": "X", "ts": start * 1e6, "dur": duration_ms * 1000,
+                 "pid": os.getpid(), "tid": threading.get_ident(),
+                 "args": dict(args, loop_id=loop_id, iteration=self.iteration)}
+        with self.lock:
+            if len(self.events) < PROFILER_MAX_EVENTS:
+                self.events.append(event)
+            else:
+                if self.dropped == 0:
+                    logging.warning(f"Cyclist: profiler has {PROFILER_MAX_EVENTS} spans without a new iteration, next ones are not traced")
+                self.dropped += 1
+            if name not in self.durations:
+                self.durations[name] = deque(maxlen=PROFILER_SUMMARY_WINDOW)
+            self.durations[name].append(duration_ms)
+
+    def next_iteration(self, enabled, loop_id):
+        """Saves spans of the iteration that just ended and starts a new one"""
+        with self.lock:
+            events = self.events
+            self.events = []
+            self.dropped = 0
+            finished_iteration = self.iteration
+            finished_loop_id = self.loop_id
+            self.iteration += 1
+            self.loop_id = loop_id
+            self.enabled = enabled
+        if events:
+            self.save_trace(events, finished_loop_id, finished_iteration)
+
+    def save_trace(self, events, loop_id, iteration):
+        folder = os.path.join(folder_paths.get_output_directory(), PROFILER_FOLDER)
+        name = str(loop_id).replace("/", "_").replace("\\", "_")
+        try:
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"{name}_{iteration:05}.json"), "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+            traces = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".json")]
+            traces.sort(key=os.path.getmtime)
+            for old in traces[:max(0, len(traces) - PROFILER_MAX_TRACES)]:
+                os.remove(old)
+        except Exception as e:
+            logging.warning(f"Cyclist: failed to save profiler trace: {e}")
+
+    def summary(self):
+        """p50/p95 of every span name over last PROFILER_SUMMARY_WINDOW spans, slowest first"""
+        with self.lock:
+            durations = {name: sorted(values) for name, values in self.durations.items()}
+        rows = []
+        for name, values in durations.items():
+            p50 = values[(len(values) - 1) // 2]
+            p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+            rows.append((p95, f"{name}: p50 {p50:.1f} ms, p95 {p95:.1f} ms ({len(values)} spans)"))
+        rows.sort(reverse=True)
+        return "\n".join(row for _, row in rows) if rows else "-- No spans recorded yet --"
+
+profiler = Profiler()
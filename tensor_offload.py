@@ -0,0 +1,92 @@
+import torch
+
+OFFLOAD_MODES = ["none", "cpu", "pinned_cpu"]
+OFFLOAD_DTYPES = {"original": None, "fp16": torch.float16, "bf16": torch.bfloat16}
+MEMORY_PLACEMENTS = ["original", "cpu"]
+
+class OffloadedTensor:
+    """Tensor moved away from its device (and maybe downcast), that remembers where it came from"""
+    __slots__ = ("tensor", "device", "dtype")
+
+    def __init__(self, tensor, device, dtype):
+        self.tensor = tensor
+        self.device = device
+        self.dtype = dtype
+
+    # Duck typing for value_bytes(): the stored size is the offloaded one
+    def numel(self):
+        return self.tensor.numel()
+
+    def element_size(self):
+        return self.tensor.element_size()
+
+    def restore(self):
+        return self.tensor.to(device=self.device, dtype=self.dtype, non_blocking=self.tensor.is_pinned())
+
+def offload_tensor(tensor, pin=False, dtype=None):
+    stored = tensor.detach()
+    if dtype is not None and stored.is_floating_point() and stored.element_size() > torch.empty((), dtype=dtype).element_size():
+        stored = stored.to(dtype=dtype) # Only downcast, never upcast
+    stored = stored.to("cpu")
+    if pin and torch.cuda.is_available():
+        try:
+            stored = stored.pin_memory()
+        except RuntimeError:
+            pass # Pinned memory is limited. Pageable is slower to copy back, but works
+    return OffloadedTensor(stored, tensor.device, tensor.dtype)
+
+def offload_value(value, mode="cpu", dtype_name="original"):
+    """Copy of a value (conditioning, latent dict, anything with tensors in lists, tuples and dicts),
+    where every tensor is offloaded. Other objects are kept as they are."""
+    if mode == "none":
+        return value
+    pin = mode == "pinned_cpu"
+    dtype = OFFLOAD_DTYPES[dtype_name]
+    def offload(v):
+        if torch.is_tensor(v):
+            return offload_tensor(v, pin, dtype)
+        if isinstance(v, dict):
+            return {key: offload(item) for key, item in v.items()}
+        if isinstance(v, list):
+            return [offload(item) for item in v]
+        if isinstance(v, tuple):
+            return tuple(offload(item) for item in v)
+        return v
+    return offload(value)
+
+def place_value(value, placement="original"):
+    """Value with every tensor moved to the device of placement. Unlike offload_value, they are meant to stay there."""
+    if placement == "original":
+        return value
+    if torch.is_tensor(value):
+        return value.to(placement)
+    if isinstance(value, dict):
+        return {key: place_value(item, placement) for key, item in value.items()}
+    if isinstance(value, list):
+        return [place_value(item, placement) for item in value]
+    if isinstance(value, tuple):
+        return tuple(place_value(item, placement) for item in value)
+    return value
+
+def restore_value(value):
+    """Reverse of offload_value: every offloaded tensor is copied back to its device and dtype"""
+    if isinstance(value, OffloadedTensor):
+        return value.restore()
+    if isinstance(value, dict):
+        return {key: restore_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [restore_value(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(restore_value(item) for item in value)
+    return value
+
+def offload_description(value):
+    """Where offloaded tensors of a value are kept, for the memory report. Empty if nothing is offloaded."""
+    if isinstance(value, OffloadedTensor):
+        return f"{'pinned ' if value.tensor.is_pinned() else ''}{value.tensor.device.type}, {str(value.tensor.dtype).replace('torch.', '')}"
+    items = value.values() if isinstance(value, dict) else (value if isinstance(value, (list, tuple)) else ())
+    for item in items:
+        description = offload_description(item)
+        if description:
+            return description
+    return ""
@@ -0,0 +1,86 @@
+import math
+
+TIMER_EWMA_ALPHA = 0.3 # Weight of the latest iteration in the exponential moving average
+TIMER_QUANTILE = 0.95
+
+class P2Quantile:
+    """Streaming estimate of a quantile with five markers (P-square algorithm by Jain and Chlamtac). O(1) memory and time per value."""
+    __slots__ = ("p", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        h = self.heights
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = h[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                                                              + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if h[i - 1] < parabolic < h[i + 1]:
+                    h[i] = parabolic
+                else:
+                    h[i] = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if not self.heights:
+            return 0.0
+        if len(self.heights) < 5:
+            return self.heights[min(len(self.heights) - 1, int(math.ceil(self.p * len(self.heights))) - 1)]
+        return self.heights[2]
+
+class IterationStats:
+    """Streaming statistics of iteration times: mean and variance (Welford), EWMA and a quantile estimate"""
+    __slots__ = ("count", "mean", "m2", "ewma", "quantile")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = 0.0
+        self.quantile = P2Quantile(TIMER_QUANTILE)
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.ewma = x if self.count == 1 else TIMER_EWMA_ALPHA * x + (1 - TIMER_EWMA_ALPHA) * self.ewma
+        self.quantile.add(x)
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def iterations_per_minute(self):
+        return 60.0 / self.mean if self.mean > 0 else 0.0
+
+    def predict_next(self):
+        """Pessimistic guess of the next iteration time: the quantile, or the recent trend if it's slower"""
+        return max(self.quantile.value(), self.ewma)
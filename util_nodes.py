@@ -1,8 +1,15 @@
 import sys
+import ast
 import logging
 import math
+import operator
+import functools
+import numpy as np
 import torch
 
+TENSOR_METRICS = ["size", "mse", "psnr", "cosine", "max_abs_diff"]
+COMPARE_CHUNK_ELEMENTS = 16 * 1024 * 1024 # Tensors are compared by chunks of that many elements, so a float32 copy of a chunk is 64 MB at most
+
 class CyclistMathFloat:
     """Node for simple floating point math operations between two vars. Does not check if values are safe to math."""
 
@@ -90,6 +97,206 @@ class AnyType(str):
     def __ne__(self, __value: object) -> bool:
         return False
 
+MATH_OPERATIONS = {"addition": operator.add, "subtraction": operator.sub, "multiplication": operator.mul, "division": operator.truediv,
+                   "floor division": operator.floordiv, "modulo": operator.mod, "exponentiation": operator.pow, "max": None, "min": None}
+
+def vector_math(operation, x, y):
+    """One operation over scalars, lists, NumPy arrays or torch tensors, with broadcasting. Result has the type of the "biggest" operand:
+    tensor, then array, then list, then scalar. Tensors stay on their device. A list of tensors is stacked into one tensor."""
+    x = stack_tensors(x)
+    y = stack_tensors(y)
+    if torch.is_tensor(x) or torch.is_tensor(y):
+        device = x.device if torch.is_tensor(x) else y.device
+        x = torch.as_tensor(x, device=device)
+        y = torch.as_tensor(y, device=device)
+        if operation == "max":
+            return torch.where(x >= y, x, y)
+        if operation == "min":
+            return torch.where(x <= y, x, y)
+        return MATH_OPERATIONS[operation](x, y)
+    if isinstance(x, (np.ndarray, list, tuple)) or isinstance(y, (np.ndarray, list, tuple)):
+        as_list = not isinstance(x, np.ndarray) and not isinstance(y, np.ndarray)
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if operation == "max":
+            result = np.maximum(x, y)
+        elif operation == "min":
+            result = np.minimum(x, y)
+        else:
+            result = MATH_OPERATIONS[operation](x, y)
+        return result.tolist() if as_list else result
+    if operation == "max":
+        return max(x, y)
+    if operation == "min":
+        return min(x, y)
+    return MATH_OPERATIONS[operation](x, y)
+
+def stack_tensors(value):
+    """List of tensors -> one tensor with a new first dimension. Anything else is returned as is."""
+    if isinstance(value, (list, tuple)) and len(value) > 0 and all(torch.is_tensor(v) for v in value):
+        return torch.stack([v.to(value[0].device) for v in value])
+    return value
+
+class CyclistMathVector:
+    """Node for math operations over whole schedules at once: numbers, lists, NumPy arrays or tensors, broadcast against each other.
+    A list of values coming from a node with list output is calculated as one vector too."""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return { "required": { "operation": (list(MATH_OPERATIONS),),
+                               "x": (AnyType("*"), ),
+                               "y": (AnyType("*"), )}}
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = (AnyType("*"), )
+    OUTPUT_IS_LIST = (True, )
+    FUNCTION = "calc"
+    CATEGORY = "cyclist/Utilities"
+
+    #NODE_NAME = "Vector Math"
+
+    def calc(self, operation, x, y):
+        # Every input comes as a list: one item is a single value, several items are a vector
+        is_list = len(x) > 1 or len(y) > 1
+        x = x[0] if len(x) == 1 else x
+        y = y[0] if len(y) == 1 else y
+        result = vector_math(operation[0], x, y)
+        if is_list and torch.is_tensor(result):
+            result = list(result.unbind(0)) # Stacked tensors go out as a list again
+        return (result if is_list else [result], )
+
+EXPRESSION_VARIABLES = ("a", "b", "c", "d", "e", "f")
+EXPRESSION_MAX_INT_BITS = 4096 # Integer powers with bigger results are computed as floats, so a typo can't hang the server
+
+def safe_power(a, b):
+    """a ** b that doesn't build giant integers, and gives inf instead of OverflowError"""
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and max(a.bit_length(), 1) * b > EXPRESSION_MAX_INT_BITS:
+        a = float(a)
+    try:
+        result = a ** b
+        return math.nan if isinstance(result, complex) else result # Fractional power of a negative number
+    except OverflowError:
+        negative = a < 0 and float(b).is_integer() and int(b) % 2 == 1
+        return -math.inf if negative else math.inf
+
+EXPRESSION_BINARY = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+                     ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: safe_power}
+EXPRESSION_UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_}
+EXPRESSION_COMPARE = {ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Eq: operator.eq, ast.NotEq: operator.ne}
+EXPRESSION_FUNCTIONS = {"min": min, "max": max, "abs": abs, "round": round, "floor": math.floor, "ceil": math.ceil,
+                        "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "sin": math.sin, "cos": math.cos, "tan": math.tan,
+                        "clamp": lambda x, low, high: max(low, min(x, high)),
+                        "lerp": lambda a, b, t: a + (b - a) * t}
+EXPRESSION_CONSTANTS = {"pi": math.pi, "tau": math.tau, "True": True, "False": False}
+
+def compile_expression_node(node, variables):
+    """Turns a parsed expression into nested closures. Only numbers, variables, operators and functions from the lists above are allowed."""
+    if isinstance(node, ast.Constant):
+        if type(node.value) not in (int, float, bool):
+            raise Exception(f"Only numbers are allowed in expressions, not {node.value!r}")
+        value = node.value
+        return lambda env: value
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in variables:
+            return lambda env: env[name]
+        if name in EXPRESSION_CONSTANTS:
+            value = EXPRESSION_CONSTANTS[name]
+            return lambda env: value
+        raise Exception(f"Unknown name in expression: {name}")
+    if isinstance(node, ast.BinOp) and type(node.op) in EXPRESSION_BINARY:
+        op = EXPRESSION_BINARY[type(node.op)]
+        left = compile_expression_node(node.left, variables)
+        right = compile_expression_node(node.right, variables)
+        return lambda env: op(left(env), right(env))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in EXPRESSION_UNARY:
+        op = EXPRESSION_UNARY[type(node.op)]
+        operand = compile_expression_node(node.operand, variables)
+        return lambda env: op(operand(env))
+    if isinstance(node, ast.BoolOp):
+        values = [compile_expression_node(v, variables) for v in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda env: all(v(env) for v in values)
+        return lambda env: any(v(env) for v in values)
+    if isinstance(node, ast.Compare) and all(type(op) in EXPRESSION_COMPARE for op in node.ops):
+        ops = [EXPRESSION_COMPARE[type(op)] for op in node.ops]
+        operands = [compile_expression_node(v, variables) for v in [node.left] + node.comparators]
+        def compare(env):
+            values = [v(env) for v in operands]
+            return all(op(values[i], values[i + 1]) for i, op in enumerate(ops))
+        return compare
+    if isinstance(node, ast.IfExp):
+        test = compile_expression_node(node.test, variables)
+        body = compile_expression_node(node.body, variables)
+        orelse = compile_expression_node(node.orelse, variables)
+        return lambda env: body(env) if test(env) else orelse(env)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in EXPRESSION_FUNCTIONS and not node.keywords:
+        function = EXPRESSION_FUNCTIONS[node.func.id]
+        args = [compile_expression_node(v, variables) for v in node.args]
+        return lambda env: function(*[a(env) for a in args])
+    raise Exception(f"Not allowed in expressions: {ast.dump(node)[:80]}")
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(formula):
+    """Formula text -> function of a dict with variables. Parsed once per formula."""
+    tree = ast.parse(formula.strip(), mode="eval")
+    return compile_expression_node(tree.body, EXPRESSION_VARIABLES)
+
+class CyclistExpression:
+    """Node to calculate a whole formula at once, instead of a chain of math nodes. Variables a-f are optional inputs, 0 if not connected.
+    Python syntax: + - * / // % **, comparisons, and/or/not, "x if condition else y", and functions from EXPRESSION_FUNCTIONS."""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return { "required": { "formula": ("STRING", {"default": "a * b + c", "multiline": True})},
+                 "optional": { name: (AnyType("*"), ) for name in EXPRESSION_VARIABLES}}
+
+    RETURN_TYPES = ("FLOAT", "INT", "BOOLEAN")
+    FUNCTION = "calc"
+    CATEGORY = "cyclist/Utilities"
+
+    #NODE_NAME = "Expression"
+
+    def calc(self, formula, **variables):
+        env = {}
+        for name in EXPRESSION_VARIABLES:
+            value = variables.get(name, 0)
+            if isinstance(value, bool):
+                value = int(value)
+            elif not isinstance(value, (int, float)):
+                value = my_cast(value)[2]
+                if value is None:
+                    raise Exception(f"Variable {name} of expression is not a number")
+            env[name] = value
+        try:
+            result = compile_expression(formula)(env)
+        except OverflowError: # exp() of a big number, or an integer too big for a float
+            logging.warn(f"Expression overflows: {formula}")
+            result = math.inf
+        except ValueError as e: # sqrt(-1), log(0) and such
+            logging.warn(f"Expression has no real result ({e}): {formula}")
+            result = math.nan
+        except ZeroDivisionError:
+            raise Exception(f"Division by zero in expression: {formula}")
+        return (expression_float(result), expression_int(result), bool(result))
+
+def expression_float(result):
+    try:
+        return float(result)
+    except OverflowError: # Integer bigger than any float
+        return math.inf if result > 0 else -math.inf
+
+def expression_int(result):
+    """Rounded result, clamped to what INT widgets take. NaN gives 0."""
+    if isinstance(result, float):
+        if math.isnan(result):
+            logging.warn("Expression result is NaN, INT output is 0")
+            return 0
+        if math.isinf(result):
+            return sys.maxsize if result > 0 else -sys.maxsize - 1
+        result = round(result)
+    return max(-sys.maxsize - 1, min(int(result), sys.maxsize))
+
 class CyclistTypeCast:
     """Tries to cast any input into str, int, float and bool. Int returns mathematically rounded. Float and int return None on fails."""
 
@@ -128,52 +335,55 @@ def my_cast(anything):
     return (str(anything), result_int, result_float, result_bool)
 
 class CyclistCompare:
-    """Tries to compare any two inputs. If different types provided, they would be cast to equal types. Order of prefered casts: bool, float, str."""
+    """Tries to compare any two inputs. If different types provided, they would be cast to equal types. Order of prefered casts: bool, float, str.
+    Images and latents can be compared by a metric (per batch item) against a threshold instead: "score" is the metric for the whole batch."""
 
     @classmethod
     def INPUT_TYPES(s):
         return { "required": {"condition": (["equals", "not equals", "greater than", "less than", "greater or equals", "less or equals"],),
                               "thing1": (AnyType("*"), ),
-                              "thing2": (AnyType("*"), )}}
+                              "thing2": (AnyType("*"), )},
+                 "optional": {"tensor_metric": (TENSOR_METRICS, {"default": "size"}),
+                              "threshold": ("FLOAT", {"default": 0.0, "min": -sys.float_info.max, "max": sys.float_info.max, "step": 0.001, "round": False})}}
     
-    RETURN_TYPES = ("BOOLEAN", )
+    RETURN_TYPES = ("BOOLEAN", "FLOAT", "BOOLEAN")
+    RETURN_NAMES = ("result", "score", "item_results")
+    OUTPUT_IS_LIST = (False, False, True)
     FUNCTION = "compare"
     CATEGORY = "cyclist/Utilities"
 
     #NODE_NAME = "Compare Anything"
 
-    def compare(self, condition, thing1, thing2):
+    def compare(self, condition, thing1, thing2, tensor_metric="size", threshold=0.0):
+        tensor1 = as_tensor(thing1)
+        tensor2 = as_tensor(thing2)
+        if tensor_metric != "size" and not tensor1 is None and not tensor2 is None:
+            scores, score = tensor_scores(tensor1, tensor2, tensor_metric, as_images=is_image(thing1) or is_image(thing2))
+            item_results = [self.compare_float(item, threshold, condition) for item in scores]
+            return (all(item_results), score, item_results)
+        result = self.compare_things(condition, thing1, thing2, tensor1, tensor2)
+        return (result, float(result), [result])
+
+    def compare_things(self, condition, thing1, thing2, tensor1, tensor2):
         str1, int1, float1, bool1 = my_cast(thing1)
         str2, int2, float2, bool2 = my_cast(thing2)
-        if torch.is_tensor(thing1):
-            tensor1 = thing1
-        elif isinstance(thing1, dict) and "samples" in thing1 and torch.is_tensor(thing1["samples"]):
-            tensor1 = thing1["samples"]
-        else:
-            tensor1 = None
-        if torch.is_tensor(thing2):
-            tensor2 = thing2
-        elif isinstance(thing2, dict) and "samples" in thing2 and torch.is_tensor(thing2["samples"]):
-            tensor2 = thing2["samples"]
-        else:
-            tensor2 = None
 
         if isinstance(thing1, bool) or isinstance(thing2, bool):
-            return (self.compare_bool(bool1, bool2, condition), )
+            return self.compare_bool(bool1, bool2, condition)
         elif isinstance(thing1, str) or isinstance(thing2, str):
             if not float1 is None and not float2 is None:
-                return (self.compare_float(float1, float2, condition), )
+                return self.compare_float(float1, float2, condition)
             else:
-                return (self.compare_str(str1, str2, condition), )
+                return self.compare_str(str1, str2, condition)
         elif isinstance(thing1, float) or isinstance(thing2, float):
-            return (self.compare_float(float1, float2, condition), )
+            return self.compare_float(float1, float2, condition)
         elif isinstance(thing1, int) and isinstance(thing2, int):
-            return (self.compare_int(int1, int2, condition), )
+            return self.compare_int(int1, int2, condition)
         elif not tensor1 is None and not tensor2 is None:
-            if (tensor1.dim() == 4 and tensor1.size()[1] != 4) or (tensor2.dim() == 4 and tensor2.size()[1] != 4):
-                return (self.compare_tensors(tensor1, tensor2, condition, as_images=True), ) # Assume at least one is image
+            if is_image(thing1) or is_image(thing2):
+                return self.compare_tensors(tensor1, tensor2, condition, as_images=True) # Assume at least one is image
             else:
-                return (self.compare_tensors(tensor1, tensor2, condition), )
+                return self.compare_tensors(tensor1, tensor2, condition)
         else:
             try:
                 if condition == "equals":
@@ -192,10 +402,10 @@ class CyclistCompare:
                     raise Exception("Compare operation is not in the list")
                 if not isinstance(result, bool):
                     raise Exception("Comparison ends in a non-boolean return")
-                return (result, )
+                return result
             except:
                 logging.warn("'Compare Anything' node doesn't really know how to compare these inputs, so it falls back to compare string representations.")
-                return (self.compare_str(str1, str2, condition), )
+                return self.compare_str(str1, str2, condition)
     
     def compare_bool(self, a, b, condition):
         if condition == "equals":
@@ -291,4 +501,64 @@ class CyclistCompare:
             elif condition == "less or equals":
                 return size1 < size2 or torch.equal(a, b)
             else:
-                raise Exception("Compare operation is not in the list")
\ No newline at end of file
+                raise Exception("Compare operation is not in the list")
+
+def as_tensor(thing):
+    """Tensor of an image, or samples of a latent. None for anything else."""
+    if torch.is_tensor(thing):
+        return thing
+    if isinstance(thing, dict) and "samples" in thing and torch.is_tensor(thing["samples"]):
+        return thing["samples"]
+    return None
+
+def is_image(thing):
+    return torch.is_tensor(thing) # IMAGE is a bare [B, H, W, C] tensor, LATENT is a dict with "samples" of any channel count
+
+def tensor_scores(a, b, metric, as_images=False):
+    """Metric for every batch item, and for the whole batch. Batches of 1 are compared with every item of the other batch.
+    Computed on CPU by chunks, so memory use doesn't depend on image size. PSNR assumes values from 0 to 1, as images are."""
+    if as_images and a.dim() == 4 and b.dim() == 4 and a.size()[-1] != b.size()[-1]:
+        channels = min(a.size()[-1], b.size()[-1]) # RGB vs RGBA: transparency is ignored
+        a, b = a[..., :channels], b[..., :channels]
+    if a.dim() < 2:
+        a, b = a.reshape(1, -1), b.reshape(1, -1)
+    if a.size()[1:] != b.size()[1:] or (a.size()[0] != b.size()[0] and min(a.size()[0], b.size()[0]) != 1):
+        raise Exception(f"Can't compare tensors of different sizes: {list(a.size())} and {list(b.size())}")
+    batch_size = max(a.size()[0], b.size()[0])
+    a = a.reshape(a.size()[0], -1)
+    b = b.reshape(b.size()[0], -1)
+    elements = a.size()[1]
+    step = max(1, COMPARE_CHUNK_ELEMENTS // batch_size)
+
+    squares = torch.zeros(batch_size, dtype=torch.float64)
+    products = torch.zeros(batch_size, dtype=torch.float64)
+    norms_a = torch.zeros(batch_size, dtype=torch.float64)
+    norms_b = torch.zeros(batch_size, dtype=torch.float64)
+    max_abs = torch.zeros(batch_size, dtype=torch.float64)
+    for start in range(0, elements, step):
+        x = a[:, start:start + step].to("cpu", torch.float32)
+        y = b[:, start:start + step].to("cpu", torch.float32)
+        if metric in ("mse", "psnr"):
+            squares += (x - y).square_().sum(dim=1, dtype=torch.float64)
+        elif metric == "max_abs_diff":
+            max_abs = torch.maximum(max_abs, (x - y).abs_().amax(dim=1).double())
+        elif metric == "cosine":
+            products += (x * y).sum(dim=1, dtype=torch.float64)
+            norms_a += x.square().sum(dim=1, dtype=torch.float64).expand(batch_size)
+            norms_b += y.square().sum(dim=1, dtype=torch.float64).expand(batch_size)
+        else:
+            raise Exception("Tensor metric is not in the list")
+
+    if metric == "mse":
+        scores = squares / max(elements, 1)
+        return scores.tolist(), scores.mean().item()
+    if metric == "psnr":
+        mse = squares / max(elements, 1)
+        return psnr(mse).tolist(), psnr(mse.mean()).item()
+    if metric == "max_abs_diff":
+        return max_abs.tolist(), max_abs.max().item()
+    scores = products / (norms_a.sqrt() * norms_b.sqrt()).clamp_(min=1e-12)
+    return scores.tolist(), scores.mean().item()
+
+def psnr(mse):
+    return 10 * torch.log10(1.0 / mse) # Identical tensors give infinity
@@ -0,0 +1,83 @@
+from array import array
+from collections import deque
+
+HISTORY_CAPACITY = 100 # Default amount of last values kept by Memorize Int/Float
+
+class ValueHistory:
+    """Last values of a number, in a preallocated ring buffer. Sum, minimum and maximum are maintained on every push,
+    so mean, min, max and their positions are O(1) (min/max pushes are amortized O(1))."""
+    __slots__ = ("values", "capacity", "start", "count", "pushed", "total", "minimums", "maximums")
+
+    def __init__(self, capacity=HISTORY_CAPACITY, typecode="d"):
+        self.capacity = max(1, capacity)
+        self.values = array(typecode, [0]) * self.capacity
+        self.start = 0 # Position of the oldest value
+        self.count = 0
+        self.pushed = 0 # Values pushed ever, to know which ones left the buffer
+        self.total = 0
+        self.minimums = deque() # (push number, value) candidates for minimum, values increase
+        self.maximums = deque() # Same for maximum, values decrease
+
+    @property
+    def typecode(self):
+        return self.values.typecode
+
+    def push(self, value):
+        if self.count == self.capacity:
+            self.total -= self.values[self.start]
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+        self.values[(self.start + self.count) % self.capacity] = value
+        self.count += 1
+        self.total += value
+
+        number = self.pushed
+        self.pushed += 1
+        while self.minimums and self.minimums[-1][1] > value: # Ties keep the earliest value
+            self.minimums.pop()
+        self.minimums.append((number, value))
+        while self.maximums and self.maximums[-1][1] < value:
+            self.maximums.pop()
+        self.maximums.append((number, value))
+        oldest = self.pushed - self.count
+        while self.minimums[0][0] < oldest:
+            self.minimums.popleft()
+        while self.maximums[0][0] < oldest:
+            self.maximums.popleft()
+
+    def __len__(self):
+        return self.count
+
+    def get(self, index):
+        """Value by position: 0 is the oldest kept value, -1 is the latest"""
+        if index < -self.count or index >= self.count:
+            raise IndexError(f"History has {self.count} values, there is no index {index}")
+        if index < 0:
+            index += self.count
+        return self.values[(self.start + index) % self.capacity]
+
+    def to_list(self):
+        return [self.get(i) for i in range(self.count)]
+
+    def minimum(self):
+        return self.minimums[0][1]
+
+    def maximum(self):
+        return self.maximums[0][1]
+
+    def argmin(self):
+        """Position of the minimum, same as get() takes"""
+        return self.minimums[0][0] - (self.pushed - self.count)
+
+    def argmax(self):
+        return self.maximums[0][0] - (self.pushed - self.count)
+
+    def mean(self):
+        return self.total / self.count
+
+    def resized(self, capacity):
+        """New history of another capacity, with as many latest values as fit"""
+        history = ValueHistory(capacity, self.typecode)
+        for value in self.to_list()[-history.capacity:]:
+            history.push(value)
+        return history